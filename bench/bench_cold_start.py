@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Холодный старт Netlify функций: время импорта модуля и первого запроса
+в свежем интерпретаторе для каждой точки входа.
+
+Каждый замер - отдельный процесс python (как новый контейнер функции),
+печатается медиана из --runs запусков. Модули ищутся как на Netlify:
+netlify/functions плюс корень проекта (included_files).
+
+    python bench/bench_cold_start.py [--runs 7]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FUNCTIONS_DIR = os.path.join(ROOT_DIR, 'netlify', 'functions')
+
+# (модуль, функция, метод): POST /info отвечает без обращения к сети.
+# webhook.handler без CHAT_ID останавливается на проверке настроек (400):
+# полный путь идет на сайт и в Telegram, здесь меряется только импорт
+ENTRY_POINTS = [
+    ("bot", "handler", "GET"),
+    ("bot", "handler", "POST"),
+    ("svetbot", "lambda_handler", "GET"),
+    ("svetbot", "lambda_handler", "POST"),
+    ("webhook", "handler", "GET"),
+    ("bot_status", "handler", "GET"),
+]
+
+# Выполняется в дочернем процессе: импорт и один вызов точки входа
+CHILD = r'''
+import json, sys, time
+module_name, entry_name, method = sys.argv[1:4]
+started = time.perf_counter()
+module = __import__(module_name)
+imported = time.perf_counter()
+if method == "GET":
+    event = {"httpMethod": "GET", "path": "/"}
+else:
+    event = {"httpMethod": "POST", "body": json.dumps({
+        "update_id": 1,
+        "message": {"message_id": 1, "chat": {"id": 5, "type": "private"},
+                    "from": {"id": 7, "first_name": "A"}, "text": "/info"}})}
+response = getattr(module, entry_name)(event, {})
+done = time.perf_counter()
+print(json.dumps([imported - started, done - imported, response.get("statusCode")]))
+'''
+
+def measure(module_name, entry_name, method, runs, workdir):
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([FUNCTIONS_DIR, ROOT_DIR])
+    env.setdefault("BOT_TOKEN", "bench-token")
+    env.pop("CHAT_ID", None)
+
+    imports, requests = [], []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-c", CHILD, module_name, entry_name, method],
+            capture_output=True, text=True, cwd=workdir, env=env
+        )
+        if result.returncode != 0:
+            raise RuntimeError(f"{module_name}.{entry_name} {method}: {result.stderr[-500:]}")
+        import_time, request_time, status = json.loads(result.stdout.strip().splitlines()[-1])
+        imports.append(import_time)
+        requests.append(request_time)
+    return statistics.median(imports), statistics.median(requests), status
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    args.add_argument('--runs', type=int, default=7)
+    options = args.parse_args()
+
+    # Рабочая папка пустая: функции не должны зависеть от файлов в cwd
+    with tempfile.TemporaryDirectory(prefix='svetbot-cold-') as workdir:
+        for module_name, entry_name, method in ENTRY_POINTS:
+            import_time, request_time, status = measure(module_name, entry_name, method, options.runs, workdir)
+            print(f"{module_name}.{entry_name} {method}: cold import {import_time * 1000:.1f}ms, "
+                  f"first request {request_time * 1000:.2f}ms (status {status})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Холодная и теплая загрузка страницы графика отключений.
+
+Холодная - новая requests.Session на каждый запрос (как было до общего пула):
+каждый раз новое соединение. Теплая - долгоживущая сессия KyivEnergyParser с
+keep-alive. Сайт заменяет локальный HTTP/1.1 сервер с tests/fixtures;
+задержка --handshake-ms на каждое новое соединение изображает TCP+TLS рукопожатие
+с energy-ua.info.
+
+    python bench/bench_http_session.py [--requests 200] [--handshake-ms 30]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from power_parser import KyivEnergyParser
+
+FIXTURE = os.path.join(ROOT_DIR, 'tests', 'fixtures', 'power_on.html')
+
+def start_site(handshake):
+    """Локальная замена сайта с keep-alive и задержкой на новое соединение"""
+    with open(FIXTURE, 'rb') as f:
+        body = f.read()
+    stats = {"connections": 0}
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Заголовки и тело уходят отдельными записями - без этого keep-alive
+        # упирается в Nagle + delayed ACK (~40 мс), чего у настоящего сервера нет
+        disable_nagle_algorithm = True
+
+        def setup(self):
+            super().setup()
+            stats["connections"] += 1
+            time.sleep(handshake)
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/html; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}/", stats
+
+def cold_fetch(url):
+    # Как раньше в parse_power_status: сессия создается на каждый вызов
+    session = requests.Session()
+    session.headers.update(KyivEnergyParser.HEADERS)
+    response = session.get(url, timeout=15, allow_redirects=True)
+    response.raise_for_status()
+    return response.text
+
+def measure(fetch, count):
+    timings = []
+    for _ in range(count):
+        started = time.perf_counter()
+        fetch()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+def report(label, timings, connections):
+    q = statistics.quantiles(timings, n=100)
+    print(f"{label}: p50={q[49] * 1000:.2f}ms p99={q[98] * 1000:.2f}ms "
+          f"mean={statistics.mean(timings) * 1000:.2f}ms connections={connections}")
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    args.add_argument('--requests', type=int, default=200)
+    args.add_argument('--handshake-ms', type=float, default=30.0)
+    options = args.parse_args()
+
+    server, url, stats = start_site(options.handshake_ms / 1000)
+    try:
+        report("cold (session per call)", measure(lambda: cold_fetch(url), options.requests), stats["connections"])
+
+        stats["connections"] = 0
+        parser = KyivEnergyParser(url, retries=0)
+        try:
+            def warm_fetch():
+                response = parser.session.get(url, timeout=parser.timeout, allow_redirects=True)
+                response.raise_for_status()
+                return response.text
+
+            report("warm (pooled session)", measure(warm_fetch, options.requests), stats["connections"])
+        finally:
+            parser.close()
+    finally:
+        server.shutdown()
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""
+Стоимость одного разбора страницы: регулярки, скомпилированные при импорте,
+против прежних re.search по строке шаблона с двойным проходом по периодам.
+
+Берутся страницы из tests/fixtures; --scale повторяет текстовые узлы страницы,
+чтобы получить страницу размера настоящей (сотни КБ - единицы МБ). Для сравнения
+печатается и время выделения текста каждым движком из PARSER_BACKENDS.
+
+    python bench/bench_patterns.py [--scale 400] [--repeat 5]
+"""
+
+import argparse
+import os
+import re
+import sys
+import timeit
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from power_parser import PARSER_BACKENDS, extract_page_data
+
+FIXTURES_DIR = os.path.join(ROOT_DIR, 'tests', 'fixtures')
+
+def extract_page_data_uncompiled(texts):
+    """extract_page_data до предкомпиляции регулярок - эталон для сравнения"""
+    nodes = []
+    for text in texts:
+        text = ' '.join(text.split())
+        if text:
+            nodes.append(text)
+
+    has_power = True
+    time_left = None
+    periods = []
+
+    text_content = ' '.join(nodes).lower()
+
+    if 'має бути вимкнена' in text_content or 'відсутня' in text_content:
+        has_power = False
+
+        time_pattern = r'(\d+)год\s+(\d+)хв'
+        time_match = re.search(time_pattern, text_content)
+        if time_match:
+            hours = int(time_match.group(1))
+            minutes = int(time_match.group(2))
+            time_left = f"{hours}:{minutes:02d}"
+
+    for period_clean in nodes:
+        if re.search(r'З \d{2}:\d{2}.*до \d{2}:\d{2}', period_clean):
+            time_range_match = re.search(r'З (\d{2}:\d{2}).*до (\d{2}:\d{2})', period_clean)
+            if time_range_match:
+                start_time = time_range_match.group(1)
+                end_time = time_range_match.group(2)
+                periods.append(f"{start_time}-{end_time}")
+
+    return {"has_power": has_power, "time_left": time_left, "periods": periods}
+
+def best_ms(func, repeat):
+    """Лучшее время одного вызова из repeat замеров, мс"""
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=repeat, number=number)) / number * 1000
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    args.add_argument('--scale', type=int, default=400)
+    args.add_argument('--repeat', type=int, default=5)
+    options = args.parse_args()
+
+    for name in sorted(os.listdir(FIXTURES_DIR)):
+        if not name.endswith('.html'):
+            continue
+        with open(os.path.join(FIXTURES_DIR, name), encoding='utf-8') as f:
+            page_html = f.read()
+
+        texts = PARSER_BACKENDS['regex'](page_html) * options.scale
+        size_kb = len(page_html.encode('utf-8')) * options.scale / 1024
+        assert extract_page_data(texts) == extract_page_data_uncompiled(texts)
+
+        old = best_ms(lambda: extract_page_data_uncompiled(texts), options.repeat)
+        new = best_ms(lambda: extract_page_data(texts), options.repeat)
+        print(f"{name} x{options.scale} (~{size_kb:.0f} KB, {len(texts)} nodes): "
+              f"uncompiled {old:.2f}ms, precompiled {new:.2f}ms ({old / new:.2f}x)")
+
+        big_html = page_html * options.scale
+        backends = ", ".join(
+            f"{backend} {best_ms(lambda: PARSER_BACKENDS[backend](big_html), options.repeat):.1f}ms"
+            for backend in PARSER_BACKENDS
+        )
+        print(f"    text extraction: {backends}")
+
+if __name__ == '__main__':
+    main()
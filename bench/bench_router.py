@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Пропускная способность маршрутизации текстовых сообщений: прежние проверки
+any(word in text ...) против svetbot.route_text на синтетическом корпусе.
+
+Корпус - сообщения из 3-15 обычных слов, в --keyword-share из них вставлено
+ключевое слово. Второй прогон - тот же корпус, где после --punctuation-share
+слов стоит знак препинания: таким словам route_text нужна регулярка.
+Генератор с фиксированным seed, корпус каждый раз одинаковый.
+
+    python bench/bench_router.py [--messages 100000] [--repeat 5]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'tests'))
+
+# Как в тестах: config.py из шаблона, файлы статистики во временной папке
+import conftest  # noqa: F401
+
+import svetbot
+
+WORDS = (
+    "привет как дела сегодня завтра будет дождь работа пойдем обедать кто где я дома "
+    "скинь фото ок да нет спасибо хорошо может вечером встретимся купи хлеба"
+).split()
+KEYWORDS = ["свет", "покурить", "рейтинг", "статус", "помощь", "світло", "топ"]
+
+def route_any(text):
+    """Маршрутизация до route_text: подстроки в порядке приоритета"""
+    text = text.lower()
+    if any(word in text for word in ['свет', 'электричество', 'ток', 'света']):
+        return "light"
+    elif any(word in text for word in ['статус', 'состояние', 'як справи']):
+        return "status"
+    elif any(word in text for word in ['курить', 'покурить', 'дымить', 'косяк', 'травку', 'smoke']):
+        return "smoke"
+    elif any(word in text for word in ['рейтинг', 'топ', 'rating', 'курильщики']):
+        return "rating"
+    elif 'помощь' in text or 'help' in text:
+        return "help"
+    return None
+
+def make_corpus(count, keyword_share, seed, punctuation_share=0.0):
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(count):
+        words = rng.choices(WORDS, k=rng.randint(3, 15))
+        if rng.random() < keyword_share:
+            words.insert(rng.randrange(len(words)), rng.choice(KEYWORDS))
+        corpus.append(words)
+
+    # Знаки препинания - отдельным генератором, чтобы слова совпадали с первым корпусом
+    rng = random.Random(seed + 1)
+    return [
+        " ".join(word + rng.choice(",.!?") if rng.random() < punctuation_share else word for word in words).capitalize()
+        for words in corpus
+    ]
+
+def main():
+    args = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    args.add_argument('--messages', type=int, default=100000)
+    args.add_argument('--keyword-share', type=float, default=0.05)
+    args.add_argument('--punctuation-share', type=float, default=0.2)
+    args.add_argument('--repeat', type=int, default=5)
+    args.add_argument('--seed', type=int, default=0)
+    options = args.parse_args()
+
+    for punctuation_share in (0.0, options.punctuation_share):
+        corpus = make_corpus(options.messages, options.keyword_share, options.seed, punctuation_share)
+        print(f"punctuation after {punctuation_share:.0%} of words:")
+        for label, route in [("any() scans", route_any), ("route_text", svetbot.route_text)]:
+            best = None
+            for _ in range(options.repeat):
+                started = time.perf_counter()
+                routed = sum(1 for text in corpus if route(text))
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+            print(f"    {label}: {len(corpus) / best / 1000:.0f}k msg/s, routed={routed}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+"""
+Нагрузочный тест обработки обновлений: синтетический поток апдейтов из
+нескольких чатов, часть обработчиков медленные (как запрос к сайту).
+
+Сравнивается последовательная обработка (SimpleUpdateProcessor(1), как было)
+с PerChatUpdateProcessor. Задержка считается от прихода апдейта до конца его
+обработки; out_of_order - апдейты чата, обработанные раньше предыдущих.
+
+    python bench/load_updates.py [--updates 1000] [--rate 200] [--chats 40]
+"""
+
+import argparse
+import asyncio
+import os
+import random
+import statistics
+import sys
+import time
+from types import SimpleNamespace
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from telegram.ext import SimpleUpdateProcessor
+
+from update_processor import PerChatUpdateProcessor
+
+FAST_HANDLER = 0.01
+SLOW_HANDLER = 0.5
+
+def make_stream(options):
+    """Один и тот же поток для всех вариантов: (апдейт, время обработчика)"""
+    rng = random.Random(options.seed)
+    stream = []
+    for number in range(options.updates):
+        update = SimpleNamespace(effective_chat=SimpleNamespace(id=rng.randrange(options.chats)), number=number)
+        cost = SLOW_HANDLER if rng.random() < options.slow_share else FAST_HANDLER
+        stream.append((update, cost))
+    return stream
+
+async def run(processor, stream, rate):
+    latencies = []
+    last_seen = {}
+    out_of_order = 0
+
+    async def handler(update, arrived, cost):
+        nonlocal out_of_order
+        await asyncio.sleep(cost)
+        latencies.append(time.monotonic() - arrived)
+        chat_id = update.effective_chat.id
+        if last_seen.get(chat_id, -1) > update.number:
+            out_of_order += 1
+        last_seen[chat_id] = update.number
+
+    queue = asyncio.Queue()
+
+    async def producer():
+        started = time.monotonic()
+        for index, (update, cost) in enumerate(stream):
+            await asyncio.sleep(max(0, started + index / rate - time.monotonic()))
+            queue.put_nowait((update, cost, time.monotonic()))
+        queue.put_nowait(None)
+
+    async def consumer():
+        # Как цикл выборки апдейтов в Application: при concurrent_updates
+        # каждый апдейт уходит в отдельную задачу, иначе ждем обработчик
+        tasks = []
+        while True:
+            item = await queue.get()
+            if item is None:
+                break
+            update, cost, arrived = item
+            coroutine = processor.process_update(update, handler(update, arrived, cost))
+            if processor.max_concurrent_updates > 1:
+                tasks.append(asyncio.create_task(coroutine))
+            else:
+                await coroutine
+        await asyncio.gather(*tasks)
+
+    await asyncio.gather(producer(), consumer())
+    return latencies, out_of_order
+
+async def main(options):
+    stream = make_stream(options)
+    variants = [("sequential", SimpleUpdateProcessor(1))]
+    variants += [(f"per-chat x{workers}", PerChatUpdateProcessor(workers)) for workers in options.workers]
+
+    for label, processor in variants:
+        latencies, out_of_order = await run(processor, stream, options.rate)
+        q = statistics.quantiles(latencies, n=100)
+        print(f"{label}: p50={q[49] * 1000:.0f}ms p99={q[98] * 1000:.0f}ms out_of_order={out_of_order}")
+
+if __name__ == '__main__':
+    args = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    args.add_argument('--updates', type=int, default=1000)
+    args.add_argument('--rate', type=float, default=200, help="апдейтов в секунду")
+    args.add_argument('--chats', type=int, default=40)
+    args.add_argument('--slow-share', type=float, default=0.02)
+    args.add_argument('--workers', type=int, nargs='+', default=[8, 32])
+    args.add_argument('--seed', type=int, default=1)
+    asyncio.run(main(args.parse_args()))
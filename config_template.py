@@ -12,4 +12,57 @@ class Config:
     SITE_URL = "https://example.com"
     
     # Интервал проверки в минутах
-    CHECK_INTERVAL = 30
\ No newline at end of file
+    CHECK_INTERVAL = 30
+    
+    # Время жизни кэша статуса света в секундах
+    # (по умолчанию совпадает с CHECK_INTERVAL)
+    # STATUS_CACHE_TTL = 30 * 60
+    
+    # Настройки HTTP сессии для сайта с графиком
+    # HTTP_POOL_SIZE = 4          # размер пула соединений
+    # HTTP_RETRIES = 2            # повторы при ошибках сети и 5xx
+    # HTTP_TIMEOUT = (5, 15)      # таймауты подключения и чтения, сек
+    
+    # Движок разбора страницы: auto, selectolax, lxml, regex или bs4
+    # (auto выбирает самый быстрый из установленных)
+    # PARSER_BACKEND = "auto"
+    
+    # Потоковый разбор: читать страницу кусками и останавливаться,
+    # как только статус и расписание найдены
+    # STREAM_PARSE = False
+    
+    # Хранилище статистики /smoke: "memory" (в памяти + журнал) или "sqlite"
+    # SMOKE_STORAGE = "memory"
+    # SMOKE_STATS_PATH = "smoke_stats.json"   # снимок для режима memory
+    # SMOKE_FLUSH_EVERY = 20                  # запись журнала после N изменений
+    # SMOKE_FLUSH_INTERVAL = 5                # ... или раз в N секунд
+    # База для режима sqlite (старый smoke_stats.json переносится автоматически)
+    # SMOKE_DB_PATH = "smoke_stats.db"
+    # Разделы статистики по чатам и сколько из них держать открытыми
+    # SMOKE_CHATS_DIR = "smoke_chats"
+    # SMOKE_MAX_OPEN_CHATS = 50
+    
+    # Лимиты исходящих сообщений (запросов в секунду): весь бот, личный чат, группа
+    # RATE_LIMIT_GLOBAL = 30
+    # RATE_LIMIT_CHAT = 1
+    # RATE_LIMIT_GROUP = 20 / 60
+    
+    # Кэш file_id отправленных GIF
+    # MEDIA_CACHE_PATH = "media_cache.json"
+    
+    # Сколько обновлений обрабатывать одновременно; в одном чате они
+    # всегда обрабатываются по очереди (1 - вообще все по очереди)
+    # CONCURRENT_UPDATES = 8
+    
+    # Режим webhook вместо long polling: задайте публичный адрес бота.
+    # Встроенный сервер слушает WEBHOOK_LISTEN:WEBHOOK_PORT/WEBHOOK_PATH и
+    # проверяет заголовок X-Telegram-Bot-Api-Secret-Token
+    # WEBHOOK_URL = "https://bot.example.com"
+    # WEBHOOK_PATH = "telegram"
+    # WEBHOOK_SECRET = "длинная-случайная-строка"
+    # WEBHOOK_LISTEN = "0.0.0.0"
+    # WEBHOOK_PORT = 8443
+    # WEBHOOK_MAX_CONNECTIONS = 40   # одновременных соединений от Telegram
+    
+    # Адрес Bot API (свой сервер или фейковый Telegram для локальной проверки)
+    # TELEGRAM_API_URL = "http://127.0.0.1:8081/bot"
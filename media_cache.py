@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Кэш file_id медиафайлов, уже загруженных в Telegram, для SVETOBOT
+"""
+
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+class MediaCache:
+    """
+    Запоминает file_id, который Telegram вернул при первой отправке файла
+    по URL, чтобы дальше отправлять файл по file_id без повторной загрузки.
+    Кэш хранится в JSON и переживает перезапуск; запись, с которой отправка
+    не удалась, удаляется.
+    """
+    def __init__(self, path="media_cache.json"):
+        self.path = path
+        self._file_ids = self._load()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url):
+        """file_id для URL или None, если файл еще не загружался"""
+        file_id = self._file_ids.get(url)
+        if file_id is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return file_id
+
+    def set(self, url, file_id):
+        if file_id and self._file_ids.get(url) != file_id:
+            self._file_ids[url] = file_id
+            self._save()
+
+    def invalidate(self, url):
+        if self._file_ids.pop(url, None) is not None:
+            self._save()
+
+    def stats(self):
+        """Счетчики попаданий в кэш"""
+        return {"size": len(self._file_ids), "hits": self.hits, "misses": self.misses}
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Ошибка чтения кэша медиа {self.path}: {e}")
+            return {}
+
+    def _save(self):
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._file_ids, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Ошибка сохранения кэша медиа {self.path}: {e}")
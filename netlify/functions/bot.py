@@ -4,13 +4,21 @@ SvetBot - Serverless version for Netlify Functions
 Telegram Bot с командой /smoke и рейтингом курильщиков
 """
 
+import hmac
 import json
 import os
 import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
-import requests
 import random
 
+from bot_status import status_response
+# Общий с svetbot.py модуль из корня репозитория (included_files в netlify.toml)
+from smoke_store import Leaderboard
+
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -50,20 +58,472 @@ def get_smoke_rank(count):
     else:
         return {"title": "Божество дыма", "icon": "💎"}
 
-# Статистика пользователей (в памяти для serverless)
-smoke_stats = {}
+class StateBackend:
+    """
+    Хранилище статистики /smoke для serverless бота.
+    Рейтинг с chat_id=None - общий по всем чатам.
+    """
+    def increment(self, chat_id, user_id, name, last_smoke):
+        """Атомарно +1 в рейтинге чата и в общем, возвращает счетчик в чате"""
+        raise NotImplementedError
+    
+    def leaderboard(self, chat_id, user_id=None, limit=5):
+        """
+        Топ, место пользователя и число участников одним чтением:
+        {"top": [(user_id, {name, count}), ...], "position": int или None, "total": int}
+        """
+        raise NotImplementedError
+    
+    def user_count(self):
+        """Сколько пользователей в общем рейтинге"""
+        return self.leaderboard(None, limit=0)["total"]
+    
+    def claim_update(self, update_id, window):
+        """
+        Отмечает update_id обработанным на window секунд для всех экземпляров.
+        True - обновление пришло впервые. Без общего хранилища всегда True
+        """
+        return True
+    
+    def release_update(self, update_id):
+        """Снимает отметку claim_update, если обновление так и не было принято"""
+    
+    def mark_handled(self, update_id, reply, window):
+        """
+        Запоминает на window секунд, что обработчик очереди уже выполнил
+        обновление, и его ответ - повтор отправит только ответ
+        """
+    
+    def handled_reply(self, update_id):
+        """{"reply": ответ или None}, если обновление уже выполнено, иначе None"""
+        return None
+
+class MemoryStateBackend(StateBackend):
+    """Статистика в памяти экземпляра функции (пропадает при холодном старте)"""
+    HANDLED_SIZE = 1024
+    
+    def __init__(self):
+        self._boards = {}
+        self._handled = OrderedDict()
+    
+    def increment(self, chat_id, user_id, name, last_smoke):
+        counts = []
+        for board_id in (chat_id, None):
+            board = self._boards.setdefault(board_id, Leaderboard())
+            board.update(user_id, board.count(user_id) + 1, name)
+            counts.append(board.count(user_id))
+        return counts[0]
+    
+    def leaderboard(self, chat_id, user_id=None, limit=5):
+        board = self._boards.get(chat_id) or Leaderboard()
+        return {
+            "top": board.top(limit),
+            "position": board.position(user_id) if user_id else None,
+            "total": len(board)
+        }
+    
+    def mark_handled(self, update_id, reply, window):
+        self._handled[update_id] = reply
+        if len(self._handled) > self.HANDLED_SIZE:
+            self._handled.popitem(last=False)
+    
+    def handled_reply(self, update_id):
+        if update_id not in self._handled:
+            return None
+        return {"reply": self._handled[update_id]}
+
+class SQLiteStateBackend(StateBackend):
+    """
+    Статистика в файле SQLite. Общий рейтинг хранится строками с chat_id '*',
+    оба счетчика увеличиваются в одной транзакции.
+    """
+    GLOBAL_CHAT = "*"
+    
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS smoke_stats ("
+            "chat_id TEXT NOT NULL, user_id TEXT NOT NULL, name TEXT NOT NULL, "
+            "count INTEGER NOT NULL DEFAULT 0, last_smoke TEXT NOT NULL DEFAULT '', "
+            "PRIMARY KEY (chat_id, user_id))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS smoke_stats_rank ON smoke_stats (chat_id, count DESC, user_id)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS processed_updates (update_id INTEGER PRIMARY KEY, seen_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS handled_updates ("
+            "update_id INTEGER PRIMARY KEY, reply TEXT NOT NULL, handled_at REAL NOT NULL)"
+        )
+        self._claims = 0
+    
+    def increment(self, chat_id, user_id, name, last_smoke):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for board_id in (str(chat_id), self.GLOBAL_CHAT):
+                    self._conn.execute(
+                        "INSERT INTO smoke_stats (chat_id, user_id, name, count, last_smoke) "
+                        "VALUES (?, ?, ?, 1, ?) ON CONFLICT (chat_id, user_id) DO UPDATE SET "
+                        "count = count + 1, name = excluded.name, last_smoke = excluded.last_smoke",
+                        (board_id, user_id, name, last_smoke)
+                    )
+                count = self._conn.execute(
+                    "SELECT count FROM smoke_stats WHERE chat_id = ? AND user_id = ?",
+                    (str(chat_id), user_id)
+                ).fetchone()[0]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return count
+    
+    def leaderboard(self, chat_id, user_id=None, limit=5):
+        board_id = self.GLOBAL_CHAT if chat_id is None else str(chat_id)
+        with self._lock:
+            top = self._conn.execute(
+                "SELECT user_id, name, count FROM smoke_stats WHERE chat_id = ? "
+                "ORDER BY count DESC, user_id LIMIT ?", (board_id, limit)
+            ).fetchall()
+            total = self._conn.execute(
+                "SELECT COUNT(*) FROM smoke_stats WHERE chat_id = ?", (board_id,)
+            ).fetchone()[0]
+            position = None
+            if user_id:
+                row = self._conn.execute(
+                    "SELECT 1 + (SELECT COUNT(*) FROM smoke_stats AS other WHERE other.chat_id = me.chat_id "
+                    "AND (other.count > me.count OR (other.count = me.count AND other.user_id < me.user_id))) "
+                    "FROM smoke_stats AS me WHERE me.chat_id = ? AND me.user_id = ?", (board_id, user_id)
+                ).fetchone()
+                position = row[0] if row else None
+        return {
+            "top": [(uid, {"name": name, "count": count}) for uid, name, count in top],
+            "position": position,
+            "total": total
+        }
+
+    def claim_update(self, update_id, window):
+        now = time.time()
+        with self._lock:
+            claimed = self._conn.execute(
+                "INSERT OR IGNORE INTO processed_updates (update_id, seen_at) VALUES (?, ?)",
+                (update_id, now)
+            ).rowcount == 1
+            # Старые записи чистим изредка, а не на каждом обновлении
+            self._claims += 1
+            if self._claims % 100 == 0:
+                self._conn.execute("DELETE FROM processed_updates WHERE seen_at < ?", (now - window,))
+        return claimed
+    
+    def release_update(self, update_id):
+        with self._lock:
+            self._conn.execute("DELETE FROM processed_updates WHERE update_id = ?", (update_id,))
+    
+    def mark_handled(self, update_id, reply, window):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO handled_updates (update_id, reply, handled_at) VALUES (?, ?, ?)",
+                (update_id, json.dumps(reply), now)
+            )
+            self._conn.execute("DELETE FROM handled_updates WHERE handled_at < ?", (now - window,))
+    
+    def handled_reply(self, update_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT reply FROM handled_updates WHERE update_id = ?", (update_id,)
+            ).fetchone()
+        return {"reply": json.loads(row[0])} if row else None
+
+class KVStateBackend(StateBackend):
+    """
+    Статистика в Redis через REST API в стиле Upstash (POST /pipeline, /multi-exec).
+    Рейтинги - sorted set на чат и общий, имена - в общем hash.
+    Для проверки подойдет любой локальный сервер с тем же API.
+    """
+    KV_TIMEOUT = (2, 5)
+    
+    def __init__(self, url, token, prefix="svetbot"):
+        self.url = url.rstrip("/")
+        self.token = token
+        self.prefix = prefix
+    
+    def _board_key(self, chat_id):
+        return f"{self.prefix}:smoke:{'global' if chat_id is None else chat_id}"
+    
+    def execute(self, endpoint, commands):
+        response = get_http_session().post(
+            f"{self.url}/{endpoint}",
+            json=commands,
+            headers={"Authorization": f"Bearer {self.token}"},
+            timeout=self.KV_TIMEOUT
+        )
+        response.raise_for_status()
+        results = response.json()
+        for result in results:
+            if "error" in result:
+                raise RuntimeError(f"KV error: {result['error']}")
+        return [result.get("result") for result in results]
+    
+    def increment(self, chat_id, user_id, name, last_smoke):
+        results = self.execute("multi-exec", [
+            ["ZINCRBY", self._board_key(chat_id), 1, user_id],
+            ["ZINCRBY", self._board_key(None), 1, user_id],
+            ["HSET", f"{self.prefix}:names", user_id, name],
+            ["HSET", f"{self.prefix}:last_smoke", user_id, last_smoke],
+        ])
+        return int(float(results[0]))
+    
+    def leaderboard(self, chat_id, user_id=None, limit=5):
+        key = self._board_key(chat_id)
+        commands = [["ZCARD", key]]
+        if limit:
+            commands.append(["ZREVRANGE", key, 0, limit - 1, "WITHSCORES"])
+        if user_id:
+            commands.append(["ZREVRANK", key, user_id])
+        results = self.execute("pipeline", commands)
+        
+        total = int(results[0])
+        flat = results[1] if limit else []
+        rank = results[-1] if user_id else None
+        
+        ids = flat[0::2]
+        names = self.execute("pipeline", [["HMGET", f"{self.prefix}:names", *ids]])[0] if ids else []
+        top = [
+            (uid, {"name": name or uid, "count": int(float(score))})
+            for uid, score, name in zip(ids, flat[1::2], names)
+        ]
+        return {
+            "top": top,
+            "position": int(rank) + 1 if rank is not None else None,
+            "total": total
+        }
+
+    def claim_update(self, update_id, window):
+        result = self.execute("pipeline", [["SET", f"{self.prefix}:update:{update_id}", 1, "NX", "EX", window]])[0]
+        return result == "OK"
+    
+    def release_update(self, update_id):
+        self.execute("pipeline", [["DEL", f"{self.prefix}:update:{update_id}"]])
+    
+    def mark_handled(self, update_id, reply, window):
+        self.execute("pipeline", [["SET", f"{self.prefix}:handled:{update_id}", json.dumps(reply), "EX", window]])
+    
+    def handled_reply(self, update_id):
+        stored = self.execute("pipeline", [["GET", f"{self.prefix}:handled:{update_id}"]])[0]
+        return {"reply": json.loads(stored)} if stored is not None else None
+
+class CachedStateBackend(StateBackend):
+    """
+    Кэш чтений рейтинга внутри экземпляра функции на ttl секунд.
+    Свои изменения сбрасывают кэш сразу, чужие видны не позже чем через ttl.
+    Теплый контейнер живет долго, поэтому кэш - LRU на size записей.
+    """
+    def __init__(self, backend, ttl=5, size=256):
+        self.backend = backend
+        self.ttl = ttl
+        self.size = size
+        self._cache = OrderedDict()
+    
+    def increment(self, chat_id, user_id, name, last_smoke):
+        count = self.backend.increment(chat_id, user_id, name, last_smoke)
+        self._cache.clear()
+        return count
+    
+    def leaderboard(self, chat_id, user_id=None, limit=5):
+        key = (chat_id, user_id, limit)
+        cached = self._cache.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._cache.move_to_end(key)
+            return cached[1]
+        
+        board = self.backend.leaderboard(chat_id, user_id, limit)
+        self._cache[key] = (time.monotonic() + self.ttl, board)
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.size:
+            self._cache.popitem(last=False)
+        return board
+
+    def claim_update(self, update_id, window):
+        return self.backend.claim_update(update_id, window)
+    
+    def release_update(self, update_id):
+        self.backend.release_update(update_id)
+    
+    def mark_handled(self, update_id, reply, window):
+        self.backend.mark_handled(update_id, reply, window)
+    
+    def handled_reply(self, update_id):
+        return self.backend.handled_reply(update_id)
+
+def create_state_backend():
+    """Хранилище по STATE_BACKEND: memory (по умолчанию), sqlite или kv"""
+    kind = os.getenv("STATE_BACKEND", "memory")
+    if kind == "sqlite":
+        backend = SQLiteStateBackend(os.getenv("STATE_DB_PATH", "/tmp/svetbot_state.db"))
+    elif kind == "kv":
+        backend = KVStateBackend(os.getenv("KV_REST_API_URL"), os.getenv("KV_REST_API_TOKEN"))
+    else:
+        return MemoryStateBackend()
+    return CachedStateBackend(backend, ttl=float(os.getenv("STATE_CACHE_TTL", "5")))
+
+# Статистика /smoke: {chat_id: рейтинг} и общий рейтинг по всем чатам
+state = create_state_backend()
+
+# Telegram повторяет доставку, если функция ответила долго или с ошибкой.
+# Последние update_id помнит сам экземпляр, а общее хранилище - окно
+# UPDATE_DEDUP_WINDOW секунд для всех экземпляров; повтор не обрабатывается
+UPDATE_DEDUP_SIZE = 1024
+UPDATE_DEDUP_WINDOW = int(os.getenv("UPDATE_DEDUP_WINDOW", "3600"))
+recent_updates = OrderedDict()
+duplicate_updates = 0
+
+def claim_update(update_id):
+    """True, если обновление пришло впервые и его нужно обработать"""
+    global duplicate_updates
+    if update_id in recent_updates:
+        recent_updates.move_to_end(update_id)
+        duplicate_updates += 1
+        return False
+    
+    # Если хранилище недоступно, исключение уходит наверх до записи в память:
+    # иначе повторная доставка этого обновления была бы отброшена как дубль
+    claimed = state.claim_update(update_id, UPDATE_DEDUP_WINDOW)
+    
+    recent_updates[update_id] = True
+    if len(recent_updates) > UPDATE_DEDUP_SIZE:
+        recent_updates.popitem(last=False)
+    
+    if not claimed:
+        duplicate_updates += 1
+        return False
+    return True
+
+def release_update(update_id):
+    """
+    Забывает обновление, которое не удалось принять: повторную доставку
+    Telegram нужно обработать, а не пропустить как дубль
+    """
+    recent_updates.pop(update_id, None)
+    try:
+        state.release_update(update_id)
+    except Exception as e:
+        logger.error(f"Error releasing update {update_id}: {e}")
+
+def record_smoke(chat_id, user_id, user_name):
+    """Обновляет статистику в разделе чата и общую, возвращает счетчик в чате"""
+    return state.increment(chat_id, user_id, user_name, datetime.now().strftime("%Y-%m-%d %H:%M"))
+
+# Одна сессия на контейнер: теплые вызовы функции переиспользуют соединение
+# с api.telegram.org вместо нового TLS рукопожатия на каждый запрос
+TELEGRAM_TIMEOUT = (3, 10)
+
+# requests импортируется только при первом запросе: GET статуса он не нужен,
+# а импорт занимает большую часть холодного старта
+http_session = None
+session_lock = threading.Lock()
+
+def get_http_session():
+    global http_session
+    with session_lock:
+        if http_session is None:
+            import requests
+            from requests.adapters import HTTPAdapter
+            
+            http_session = requests.Session()
+            http_session.mount("https://", HTTPAdapter(pool_connections=1, pool_maxsize=4))
+    return http_session
+
+# Лимиты Telegram: около раза в секунду в один чат (с небольшим запасом)
+# и 30 запросов в секунду на бота
+CHAT_SEND_INTERVAL = 1.0
+CHAT_SEND_BURST = 3
+GLOBAL_SEND_INTERVAL = 1 / 30
+# Дольше ждать retry_after внутри функции нельзя - запрос отбрасывается
+MAX_RETRY_AFTER = 5
+
+# Расчетное время следующей отправки (GCRA): для каждого чата и для бота
+next_chat_send = {}
+next_global_send = 0.0
+send_lock = threading.Lock()
+outbound_stats = {"queued": 0, "sent": 0, "dropped": 0, "throttled": 0}
+
+def _count(key):
+    with send_lock:
+        outbound_stats[key] += 1
+
+def _reserve_send_slot(chat_id):
+    """Занимает место в лимитах чата и бота, возвращает, сколько ждать"""
+    global next_global_send
+    with send_lock:
+        now = time.monotonic()
+        chat_slot = max(now, next_chat_send.get(chat_id, 0.0))
+        start = max(now, next_global_send, chat_slot - (CHAT_SEND_BURST - 1) * CHAT_SEND_INTERVAL)
+        next_global_send = start + GLOBAL_SEND_INTERVAL
+        next_chat_send[chat_id] = chat_slot + CHAT_SEND_INTERVAL
+    return start - now
+
+def _block_chat(chat_id, seconds):
+    """Пауза для чата после ответа 429"""
+    with send_lock:
+        next_chat_send[chat_id] = time.monotonic() + seconds + (CHAT_SEND_BURST - 1) * CHAT_SEND_INTERVAL
+
+def call_telegram_api(method, payload, bot_token, retries=2):
+    """Вызов Telegram API с учетом лимитов и ответа 429 (retry_after)"""
+    url = f"https://api.telegram.org/bot{bot_token}/{method}"
+    chat_id = payload.get('chat_id')
+    _count("queued")
+    
+    for attempt in range(retries + 1):
+        delay = _reserve_send_slot(chat_id)
+        if delay > 0:
+            time.sleep(delay)
+        response = get_http_session().post(url, json=payload, timeout=TELEGRAM_TIMEOUT)
+        result = response.json()
+        
+        if response.status_code != 429:
+            _count("sent" if result.get('ok') else "dropped")
+            return result
+        
+        _count("throttled")
+        retry_after = result.get('parameters', {}).get('retry_after', 1)
+        if retry_after > MAX_RETRY_AFTER or attempt == retries:
+            break
+        
+        logger.warning(f"Telegram rate limit for chat {chat_id}, retry in {retry_after}s")
+        _block_chat(chat_id, retry_after)
+    
+    _count("dropped")
+    logger.error(f"Telegram rate limit for chat {chat_id}: {method} dropped")
+    return result
+
+def webhook_reply(chat_id, text, parse_mode='Markdown'):
+    """
+    Ответ методом в теле ответа на webhook: Telegram выполнит sendMessage
+    сам после завершения функции, отдельный запрос к API не нужен.
+    Только собирает вызов - в лимитах его учитывает тот, кто отправляет:
+    lambda_handler или call_telegram_api в обработчике очереди
+    """
+    return {
+        'method': 'sendMessage',
+        'chat_id': chat_id,
+        'text': text,
+        'parse_mode': parse_mode
+    }
 
 def send_telegram_message(chat_id, text, bot_token, parse_mode='Markdown'):
     """Отправка сообщения через Telegram API"""
     try:
-        url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
         payload = {
             'chat_id': chat_id,
             'text': text,
             'parse_mode': parse_mode
         }
-        response = requests.post(url, json=payload)
-        return response.json()
+        return call_telegram_api('sendMessage', payload, bot_token)
     except Exception as e:
         logger.error(f"Error sending message: {e}")
         return None
@@ -71,30 +531,63 @@ def send_telegram_message(chat_id, text, bot_token, parse_mode='Markdown'):
 def send_telegram_animation(chat_id, animation_url, caption, bot_token):
     """Отправка GIF анимации через Telegram API"""
     try:
-        url = f"https://api.telegram.org/bot{bot_token}/sendAnimation"
         payload = {
             'chat_id': chat_id,
             'animation': animation_url,
             'caption': caption
         }
-        response = requests.post(url, json=payload)
-        return response.json()
+        return call_telegram_api('sendAnimation', payload, bot_token)
     except Exception as e:
         logger.error(f"Error sending animation: {e}")
         return None
 
+# file_id загруженных GIF: Telegram не скачивает их заново при каждой отправке.
+# В Netlify писать можно только в /tmp, поэтому кэш живет, пока жив контейнер
+MEDIA_CACHE_PATH = os.getenv("MEDIA_CACHE_PATH", "/tmp/svetbot_media_cache.json")
+
+def _load_media_cache():
+    try:
+        with open(MEDIA_CACHE_PATH, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_media_cache():
+    tmp_path = MEDIA_CACHE_PATH + ".tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(media_file_ids, f)
+        os.replace(tmp_path, MEDIA_CACHE_PATH)
+    except OSError as e:
+        logger.error(f"Error saving media cache: {e}")
+
+media_file_ids = _load_media_cache()
+
+def send_cached_animation(chat_id, animation_url, caption, bot_token):
+    """Отправка GIF по file_id из кэша, а при первой отправке - по URL"""
+    file_id = media_file_ids.get(animation_url)
+    if file_id:
+        result = send_telegram_animation(chat_id, file_id, caption, bot_token)
+        if result and result.get('ok'):
+            return result
+        logger.warning(f"Cached file_id failed for {animation_url}, sending by URL")
+        del media_file_ids[animation_url]
+        _save_media_cache()
+    
+    result = send_telegram_animation(chat_id, animation_url, caption, bot_token)
+    if result and result.get('ok'):
+        message = result.get('result', {})
+        media = message.get('animation') or message.get('document')
+        if media:
+            media_file_ids[animation_url] = media['file_id']
+            _save_media_cache()
+    return result
+
 def process_smoke_command(user_id, user_name, chat_id, bot_token):
     """Обработка команды /smoke с анимацией и рейтингом"""
     try:
-        # Обновляем статистику пользователя
-        if user_id not in smoke_stats:
-            smoke_stats[user_id] = {"name": user_name, "count": 0, "last_smoke": ""}
-        
-        smoke_stats[user_id]["count"] += 1
-        smoke_stats[user_id]["name"] = user_name
-        smoke_stats[user_id]["last_smoke"] = datetime.now().strftime("%Y-%m-%d %H:%M")
-        
-        smoke_count = smoke_stats[user_id]["count"]
+        # Обновляем статистику пользователя в чате
+        smoke_count = record_smoke(chat_id, user_id, user_name)
         rank_info = get_smoke_rank(smoke_count)
         
         # Случайные фразы
@@ -115,16 +608,13 @@ def process_smoke_command(user_id, user_name, chat_id, bot_token):
         
         chosen_phrase = random.choice(smoke_phrases)
         
-        # Отправляем начальное сообщение
+        # Сообщения одной сцены должны прийти по порядку: сначала фраза, потом GIF
         send_telegram_message(chat_id, chosen_phrase, bot_token)
         
         # Для опытных курильщиков отправляем GIF
         if smoke_count >= 10:
-            try:
-                gif_url = random.choice(weed_gifs)
-                send_telegram_animation(chat_id, gif_url, f"🌿 {user_name} курит как профи на Netlify! 💨", bot_token)
-            except:
-                pass
+            gif_url = random.choice(weed_gifs)
+            send_cached_animation(chat_id, gif_url, f"🌿 {user_name} курит как профи на Netlify! 💨", bot_token)
         
         # Финальное сообщение с рангом
         final_messages = [
@@ -151,33 +641,46 @@ def process_smoke_command(user_id, user_name, chat_id, bot_token):
             ]
             rank_message += f"\n💬 {random.choice(motivational)}"
         
-        send_telegram_message(chat_id, rank_message, bot_token)
-        
-        return True
+        # Финальное сообщение уходит в ответе на webhook - уже после них
+        return webhook_reply(chat_id, rank_message)
         
     except Exception as e:
         logger.error(f"Error in smoke command: {e}")
-        return False
+        return None
 
-def get_smokers_leaderboard():
-    """Получить топ курильщиков"""
-    if not smoke_stats:
+def get_smokers_leaderboard(chat_id, user_id=None, show_global=False):
+    """Получить топ курильщиков чата или общий топ"""
+    board = state.leaderboard(None if show_global else chat_id, user_id, limit=5)
+    if not board["total"]:
         return "📊 Пока никто не курил на Netlify!"
     
-    sorted_users = sorted(smoke_stats.items(), key=lambda x: x[1]["count"], reverse=True)
-    leaderboard = "🏆 **Топ курильщиков Netlify:**\n\n"
+    render = _render_global_leaderboard if show_global else _render_leaderboard
+    text = render(board["top"])
+    
+    if board["position"]:
+        text += f"\n📍 Ваше место: {board['position']} из {board['total']}"
+    
+    return text
+
+def _render_global_leaderboard(top_users):
+    """Текст общего топа по всем чатам"""
+    return _render_leaderboard(top_users, title="🌍 **Общий топ курильщиков Netlify:**")
+
+def _render_leaderboard(top_users, title="🏆 **Топ курильщиков Netlify:**"):
+    """Текст топа курильщиков"""
+    leaderboard_text = f"{title}\n\n"
     
     medals = ["🥇", "🥈", "🥉", "4️⃣", "5️⃣"]
     
-    for i, (user_id, data) in enumerate(sorted_users[:5]):
+    for i, (user_id, data) in enumerate(top_users):
         medal = medals[i] if i < len(medals) else f"{i+1}️⃣"
         rank_info = get_smoke_rank(data["count"])
-        leaderboard += f"{medal} **{data['name']}** - {data['count']} покуров {rank_info['icon']}\n"
+        leaderboard_text += f"{medal} **{data['name']}** - {data['count']} покуров {rank_info['icon']}\n"
     
-    return leaderboard
+    return leaderboard_text
 
 def process_telegram_update(update_data, bot_token):
-    """Обработка обновления от Telegram"""
+    """Обработка обновления от Telegram, возвращает ответ для тела webhook или None"""
     try:
         message = update_data.get('message', {})
         chat_id = message.get('chat', {}).get('id')
@@ -207,13 +710,14 @@ def process_telegram_update(update_data, bot_token):
             
         elif text == '/smoke':
             if user_id:
-                success = process_smoke_command(user_id, user_name, chat_id, bot_token)
-                return  # Команда /smoke обрабатывается отдельно
+                return process_smoke_command(user_id, user_name, chat_id, bot_token)
             else:
                 response = "❌ Ошибка получения ID пользователя"
                 
-        elif text == '/smokers':
-            response = get_smokers_leaderboard()
+        elif text.split()[:1] == ['/smokers']:
+            # /smokers - топ чата, /smokers all - общий топ
+            show_global = text.split()[1:2] in (['all'], ['global'], ['все'])
+            response = get_smokers_leaderboard(chat_id, user_id, show_global)
             
         elif text == '/status':
             response = "🟢 **SvetBot v2.0 - Статус**\n\n"
@@ -221,7 +725,12 @@ def process_telegram_update(update_data, bot_token):
             response += f"🤖 Все системы: Работают\n"
             response += f"🌿 Команда /smoke: Активна с GIF\n"
             response += f"🏆 Рейтинг: 12 уровней\n"
-            response += f"📊 Пользователей в статистике: {len(smoke_stats)}\n"
+            response += f"📊 Пользователей в статистике: {state.user_count()}\n"
+            response += (f"📨 Сообщений: поставлено {outbound_stats['queued']}, "
+                         f"отправлено {outbound_stats['sent']}, "
+                         f"ждали лимит {outbound_stats['throttled']}, "
+                         f"отброшено {outbound_stats['dropped']}\n")
+            response += f"🔁 Повторных доставок пропущено: {duplicate_updates}\n"
             response += f"� Время: {datetime.now().strftime('%H:%M %d.%m.%Y')}"
             
         elif text == '/info':
@@ -239,12 +748,188 @@ def process_telegram_update(update_data, bot_token):
             response += "🌿 /smoke - покурить\n"
             response += "📋 /start - все команды"
         
-        # Отправляем ответ
-        send_telegram_message(chat_id, response, bot_token)
+        # Ответ уходит в теле ответа на webhook
+        return webhook_reply(chat_id, response)
         
     except Exception as e:
         logger.error(f"Error processing update: {e}")
 
+class SQLiteUpdateQueue:
+    """
+    Очередь обновлений в файле SQLite для режима быстрого ответа на webhook.
+    Подходит для локального запуска и проверки: webhook и обработчик
+    должны видеть один и тот же файл. Запись удаляется только через ack,
+    после обработки обновления.
+    """
+    def __init__(self, path):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS update_queue ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, body TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0)"
+        )
+        # Файл очереди от прежней версии - без счетчика попыток
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(update_queue)")]
+        if "attempts" not in columns:
+            self._conn.execute("ALTER TABLE update_queue ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS update_queue_dead (id INTEGER PRIMARY KEY, body TEXT NOT NULL)"
+        )
+    
+    def push(self, update):
+        with self._lock:
+            self._conn.execute("INSERT INTO update_queue (body) VALUES (?)", (json.dumps(update),))
+    
+    def peek_batch(self, limit):
+        """До limit самых старых обновлений: [(ключ для ack, обновление), ...]"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, body FROM update_queue ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [(row_id, json.loads(body)) for row_id, body in rows]
+    
+    def ack(self, row_id):
+        """Удаляет обработанное обновление из очереди"""
+        with self._lock:
+            self._conn.execute("DELETE FROM update_queue WHERE id = ?", (row_id,))
+    
+    def fail(self, row_id):
+        """Отмечает неудачную попытку, возвращает число попыток"""
+        with self._lock:
+            self._conn.execute("UPDATE update_queue SET attempts = attempts + 1 WHERE id = ?", (row_id,))
+            row = self._conn.execute("SELECT attempts FROM update_queue WHERE id = ?", (row_id,)).fetchone()
+        return row[0] if row else 0
+    
+    def park(self, row_id):
+        """Переносит обновление в update_queue_dead - очередь больше его не ждет"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO update_queue_dead (id, body) SELECT id, body FROM update_queue WHERE id = ?",
+                    (row_id,)
+                )
+                self._conn.execute("DELETE FROM update_queue WHERE id = ?", (row_id,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+class KVUpdateQueue:
+    """
+    Очередь обновлений в списке Redis через REST API: RPUSH, чтение LRANGE,
+    а обработанное обновление удаляется LREM по его телу (update_id делает
+    тела уникальными). Попытки считаются в hash по тому же телу,
+    отложенные обновления - в списке {key}:dead
+    """
+    def __init__(self, kv, key="svetbot:updates"):
+        self.kv = kv
+        self.key = key
+        self.attempts_key = f"{key}:attempts"
+        self.dead_key = f"{key}:dead"
+    
+    def push(self, update):
+        self.kv.execute("pipeline", [["RPUSH", self.key, json.dumps(update)]])
+    
+    def peek_batch(self, limit):
+        bodies = self.kv.execute("pipeline", [["LRANGE", self.key, 0, limit - 1]])[0] or []
+        return [(body, json.loads(body)) for body in bodies]
+    
+    def ack(self, body):
+        self.kv.execute("pipeline", [["LREM", self.key, 1, body], ["HDEL", self.attempts_key, body]])
+    
+    def fail(self, body):
+        return int(self.kv.execute("pipeline", [["HINCRBY", self.attempts_key, body, 1]])[0])
+    
+    def park(self, body):
+        self.kv.execute("multi-exec", [
+            ["LREM", self.key, 1, body],
+            ["RPUSH", self.dead_key, body],
+            ["HDEL", self.attempts_key, body],
+        ])
+
+def create_update_queue():
+    """Очередь по UPDATE_QUEUE: sqlite или kv; без нее обновления обрабатываются сразу"""
+    kind = os.getenv("UPDATE_QUEUE")
+    if kind == "sqlite":
+        return SQLiteUpdateQueue(os.getenv("UPDATE_QUEUE_PATH", "/tmp/svetbot_updates.db"))
+    if kind == "kv":
+        return KVUpdateQueue(KVStateBackend(os.getenv("KV_REST_API_URL"), os.getenv("KV_REST_API_TOKEN")))
+    return None
+
+# Режим быстрого ответа: webhook только кладет обновление в очередь,
+# а bot_worker.py разбирает ее пачками
+update_queue = create_update_queue()
+
+# Функция по расписанию Netlify живет около 30 секунд, а отправки ждут лимиты
+# Telegram (около сообщения в секунду на чат) - новые обновления после этого
+# времени не начинаем, они останутся в очереди до следующего запуска
+DRAIN_TIME_BUDGET = float(os.getenv("DRAIN_TIME_BUDGET", "20"))
+# После стольких неудачных попыток обновление откладывается в dead-очередь,
+# чтобы не держать все обновления за ним
+MAX_UPDATE_ATTEMPTS = int(os.getenv("MAX_UPDATE_ATTEMPTS", "3"))
+
+def handle_queued_update(update, bot_token):
+    """
+    Выполняет обновление из очереди и отправляет ответ. Обработчик меняет
+    статистику и сам шлет сообщения (фраза и GIF /smoke), поэтому выполняется
+    один раз на update_id: при повторе после ошибки отправки берется
+    сохраненный ответ
+    """
+    update_id = update.get('update_id')
+    handled = state.handled_reply(update_id) if update_id is not None else None
+    if handled is not None:
+        reply = handled["reply"]
+    else:
+        reply = process_telegram_update(update, bot_token)
+        if update_id is not None:
+            state.mark_handled(update_id, reply, UPDATE_DEDUP_WINDOW)
+    
+    if reply:
+        # Ответа на webhook уже нет - метод отправляем сами
+        payload = dict(reply)
+        method = payload.pop('method')
+        call_telegram_api(method, payload, bot_token)
+
+def drain_update_queue(bot_token, batch_size=20, time_budget=DRAIN_TIME_BUDGET):
+    """
+    Обрабатывает накопленные обновления пачками, возвращает их число.
+    Обновление удаляется из очереди только после отправки ответа, поэтому
+    таймаут или ошибка не теряет его - в следующий раз повторится отправка.
+    После MAX_UPDATE_ATTEMPTS неудач обновление откладывается
+    """
+    deadline = time.monotonic() + time_budget
+    processed = 0
+    while time.monotonic() < deadline:
+        batch = update_queue.peek_batch(batch_size)
+        if not batch:
+            break
+        for key, update in batch:
+            if time.monotonic() >= deadline:
+                return processed
+            try:
+                handle_queued_update(update, bot_token)
+            except Exception as e:
+                attempts = update_queue.fail(key)
+                if attempts < MAX_UPDATE_ATTEMPTS:
+                    # Обновление остается в очереди, повторим при следующем запуске
+                    logger.error(f"Error processing queued update (attempt {attempts}): {e}")
+                    return processed
+                logger.error(f"Queued update {update.get('update_id')} parked after {attempts} attempts: {e}")
+                update_queue.park(key)
+                continue
+            update_queue.ack(key)
+            processed += 1
+    return processed
+
+def _json_response(body, status_code=200):
+    return {
+        'statusCode': status_code,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps(body)
+    }
+
 def lambda_handler(event, context):
     """
     Serverless function handler for Netlify
@@ -254,11 +939,42 @@ def lambda_handler(event, context):
         
         # Webhook обработка
         if event.get('httpMethod') == 'POST':
+            # Секрет из setWebhook(secret_token=...) - чужие запросы не обрабатываем
+            webhook_secret = os.getenv('WEBHOOK_SECRET')
+            if webhook_secret:
+                headers = {k.lower(): v for k, v in (event.get('headers') or {}).items()}
+                if not hmac.compare_digest(headers.get('x-telegram-bot-api-secret-token', ''), webhook_secret):
+                    return _json_response({'error': 'Invalid secret token'}, status_code=403)
+            
             body = json.loads(event.get('body', '{}'))
             
+            # Повторную доставку подтверждаем сразу, без повторной обработки
+            update_id = body.get('update_id')
+            if update_id is not None and not claim_update(update_id):
+                return _json_response({'message': 'Duplicate update skipped', 'update_id': update_id})
+            
+            # Быстрый ответ: обработка позже, в bot_worker.py
+            if update_queue is not None and body:
+                try:
+                    update_queue.push(body)
+                except Exception:
+                    # Ответ 500 - Telegram доставит обновление еще раз
+                    if update_id is not None:
+                        release_update(update_id)
+                    raise
+                return _json_response({'message': 'Update queued', 'update_id': update_id})
+            
             # Обработка обновления от Telegram
+            reply = None
             if bot_token and body:
-                process_telegram_update(body, bot_token)
+                reply = process_telegram_update(body, bot_token)
+            
+            if reply:
+                # Telegram выполнит метод из ответа сам. Результат функция уже
+                # не узнает, поэтому ответ считается только поставленным в очередь
+                _count("queued")
+                _reserve_send_slot(reply['chat_id'])
+                return _json_response(reply)
             
             return {
                 'statusCode': 200,
@@ -275,22 +991,7 @@ def lambda_handler(event, context):
         
         # GET запрос - статус бота
         if event.get('httpMethod') == 'GET':
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'status': 'active',
-                    'bot_name': 'SvetBot',
-                    'version': '2.0',
-                    'features': ['light_monitoring', 'smoke_ranking', 'netlify_serverless'],
-                    'timestamp': datetime.now().isoformat(),
-                    'message': 'SvetBot is running on Netlify! 🤖⚡',
-                    'bot_configured': bool(bot_token)
-                })
-            }
+            return status_response()
             
     except Exception as e:
         logger.error(f"Serverless function error: {e}")
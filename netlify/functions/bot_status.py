@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""
+SvetBot - ответ на GET статуса, общий для функций bot и svetbot.
+Модуль легкий: svetbot отвечает на GET, не загружая bot.py
+"""
+
+import json
+import os
+from datetime import datetime
+
+STATUS_HEADERS = {
+    'Content-Type': 'application/json',
+    'Access-Control-Allow-Origin': '*'
+}
+
+def status_response():
+    """Ответ на GET статуса бота"""
+    return {
+        'statusCode': 200,
+        'headers': STATUS_HEADERS,
+        'body': json.dumps({
+            'status': 'active',
+            'bot_name': 'SvetBot',
+            'version': '2.0',
+            'features': ['light_monitoring', 'smoke_ranking', 'netlify_serverless'],
+            'message': 'SvetBot is running on Netlify! 🤖⚡',
+            'bot_configured': bool(os.getenv('BOT_TOKEN')),
+            'timestamp': datetime.now().isoformat()
+        })
+    }
+
+def handler(event, context):
+    """Netlify Functions handler: только статус бота"""
+    return status_response()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+SvetBot - обработчик очереди обновлений для режима быстрого ответа на webhook
+(UPDATE_QUEUE в переменных окружения). Запускается по расписанию Netlify
+или локально: python bot_worker.py
+"""
+
+import json
+import os
+import time
+
+from bot import drain_update_queue, update_queue
+
+def handler(event, context):
+    """Netlify Functions handler: разбирает накопленную очередь"""
+    if update_queue is None:
+        return {'statusCode': 400, 'body': json.dumps({'error': 'UPDATE_QUEUE не настроена'})}
+    
+    processed = drain_update_queue(os.getenv('BOT_TOKEN'))
+    return {'statusCode': 200, 'body': json.dumps({'processed': processed})}
+
+if __name__ == "__main__":
+    # Локальный обработчик: опрашивает очередь, пока его не остановят
+    if update_queue is None:
+        raise SystemExit("UPDATE_QUEUE не настроена")
+    
+    while True:
+        if not drain_update_queue(os.getenv('BOT_TOKEN')):
+            time.sleep(1)
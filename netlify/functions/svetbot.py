@@ -1,14 +1,14 @@
-import sys
-import os
-
-# Добавляем путь к нашему коду
-sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
-
-from netlify.functions.bot import handler
+# Точка входа Netlify: код бота лежит рядом в bot.py. Импорт откладывается
+# до первого POST - на GET статуса отвечает легкий bot_status.py
+from bot_status import status_response
 
 def main(event, context):
+    if event.get('httpMethod') == 'GET':
+        return status_response()
+    
+    from bot import handler
     return handler(event, context)
 
 # Netlify entry point
 def lambda_handler(event, context):
-    return handler(event, context)
\ No newline at end of file
+    return main(event, context)
@@ -1,9 +1,18 @@
 import json
 import os
-import requests
-from bs4 import BeautifulSoup
 from datetime import datetime
 
+# requests и парсер страницы импортируются внутри функций: на холодном
+# старте их загрузка нужна только запросам, которые реально идут на сайт.
+# power_parser - общий модуль из корня репозитория (included_files в netlify.toml)
+
+# Таймауты запроса к Telegram: (соединение, чтение)
+TELEGRAM_TIMEOUT = (3, 8)
+
+# Парсер живет между теплыми запусками: сессия, ETag и последний разбор
+# страницы позволяют не качать и не разбирать ее повторно
+energy_parser = None
+
 def handler(event, context):
     """
     Netlify Function для webhook бота
@@ -39,29 +48,30 @@ def handler(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
+def get_energy_parser(site_url):
+    """Общий парсер страницы графика, создается при первом запросе"""
+    global energy_parser
+    if energy_parser is None or energy_parser.site_url != site_url:
+        from power_parser import KyivEnergyParser
+        
+        # Адрес сменился - сессия и пул потоков старого парсера больше не нужны
+        if energy_parser is not None:
+            energy_parser.close()
+        
+        # Функция живет секунды - без повторов и с коротким таймаутом
+        energy_parser = KyivEnergyParser(site_url, max_workers=1, pool_size=1, retries=1, timeout=(3, 8))
+    return energy_parser
+
 def check_power_status(site_url):
     """
-    Проверяет статус света на сайте
-    TODO: Адаптировать под конкретный сайт
+    Проверяет статус света на сайте тем же парсером, что и svetbot.py
     """
     try:
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-        }
-        
-        response = requests.get(site_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
-        
-        # TODO: Заменить на реальный парсинг сайта
-        # Пример структуры:
-        return {
-            "has_power": True,
-            "queue": "1.1",
-            "next_outage": "14:00-18:00",
-            "update_time": datetime.now().strftime("%H:%M %d.%m.%Y")
-        }
+        status = get_energy_parser(site_url).parse_power_status()
+        # Расписание - объект, в JSON ответа функции попадают только строки
+        status = dict(status)
+        del status["schedule"]
+        return status
         
     except Exception as e:
         return {
@@ -86,6 +96,11 @@ def format_power_message(status):
     
     if status.get("next_outage"):
         message += f"\n⏰ Следующее отключение: {status['next_outage']}"
+    if status.get("time_left"):
+        message += f"\n⏳ До включения: {status['time_left']}"
+    if status.get("is_fallback"):
+        # Текст ошибки в source может сломать Markdown - без подробностей
+        message += "\n⚠️ Сайт недоступен, показано расписание по умолчанию"
     
     return message
 
@@ -93,6 +108,8 @@ def send_telegram_message(bot_token, chat_id, message):
     """
     Отправляет сообщение в Телеграм
     """
+    import requests
+    
     url = f"https://api.telegram.org/bot{bot_token}/sendMessage"
     
     data = {
@@ -101,7 +118,7 @@ def send_telegram_message(bot_token, chat_id, message):
         'parse_mode': 'Markdown'
     }
     
-    response = requests.post(url, data=data)
+    response = requests.post(url, data=data, timeout=TELEGRAM_TIMEOUT)
     response.raise_for_status()
     
     return response.json()
\ No newline at end of file
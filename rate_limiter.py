@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Очередь исходящих запросов к Telegram с учетом лимитов для SVETOBOT
+"""
+
+import asyncio
+import logging
+import time
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+# Правки одного и того же сообщения: в очереди важна только последняя
+MERGEABLE_ENDPOINTS = {"editMessageText", "editMessageCaption", "editMessageReplyMarkup"}
+
+class TokenBucket:
+    """
+    Ведро токенов: rate запросов в секунду с запасом capacity.
+    После 429 ведро блокируется на retry_after секунд.
+    """
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def wait_time(self, now):
+        """Сколько ждать до свободного токена (0 - можно отправлять)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        self.tokens -= 1
+
+    def refund(self):
+        """Возвращает токен запроса, который так и не отправили"""
+        self.tokens = min(self.capacity, self.tokens + 1)
+
+    def block(self, seconds, now):
+        """Останавливает ведро после ответа 429"""
+        self.blocked_until = max(self.blocked_until, now + seconds)
+        self.tokens = 0.0
+
+class OutboundRateLimiter(BaseRateLimiter):
+    """
+    Ограничитель исходящих запросов бота (Application.builder().rate_limiter).
+    Запросы в чат проходят через ведро чата (личный чат или группа) и общее
+    ведро бота, в порядке очереди внутри чата. На 429 чат ставится на паузу
+    retry_after и запрос повторяется. Устаревшие правки сообщения, которые
+    еще ждут в очереди, отбрасываются - уходит только последняя.
+    Запросы без chat_id (getUpdates, getMe) не ограничиваются.
+    """
+    MAX_BUCKETS = 1024
+
+    def __init__(self, global_rate=30, chat_rate=1, chat_burst=3,
+                 group_rate=20 / 60, group_burst=5, max_retries=3):
+        self.global_bucket = TokenBucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        self._buckets = {}
+        self._locks = {}
+        self._waiting = {}
+        self._latest_edit = {}
+        self.queued = 0
+        self.sent = 0
+        self.dropped = 0
+        self.throttled = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def stats(self):
+        """Счетчики очереди"""
+        return {
+            "queued": self.queued,
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "throttled": self.throttled,
+            "waiting": sum(self._waiting.values()),
+        }
+
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        chat_id = data.get("chat_id")
+        if chat_id is None:
+            return await callback(*args, **kwargs)
+
+        max_retries = rate_limit_args or self.max_retries
+        self.queued += 1
+
+        key = None
+        if endpoint in MERGEABLE_ENDPOINTS and data.get("message_id") is not None:
+            key = (chat_id, data["message_id"])
+            ticket = object()
+            self._latest_edit[key] = ticket
+
+        self._waiting[chat_id] = self._waiting.get(chat_id, 0) + 1
+        try:
+            for attempt in range(max_retries + 1):
+                async with self._lock(chat_id):
+                    if key is not None and self._latest_edit.get(key) is not ticket:
+                        # Пока ждали, пришла более новая правка этого сообщения
+                        self.dropped += 1
+                        return True
+
+                    bucket = self._bucket(chat_id)
+                    await self._acquire(bucket)
+                    if key is not None and self._latest_edit.get(key) is not ticket:
+                        # Более новая правка пришла, пока ждали токен
+                        bucket.refund()
+                        self.global_bucket.refund()
+                        self.dropped += 1
+                        return True
+                    try:
+                        result = await callback(*args, **kwargs)
+                    except RetryAfter as e:
+                        self.throttled += 1
+                        bucket.block(e.retry_after + 0.1, time.monotonic())
+                        if attempt == max_retries:
+                            self.dropped += 1
+                            logger.error(f"Лимит Telegram для чата {chat_id}: {endpoint} не отправлен")
+                            raise
+                        logger.warning(f"Лимит Telegram для чата {chat_id}, повтор через {e.retry_after} с")
+                        continue
+
+                    self.sent += 1
+                    return result
+        finally:
+            if key is not None and self._latest_edit.get(key) is ticket:
+                del self._latest_edit[key]
+            self._waiting[chat_id] -= 1
+            if not self._waiting[chat_id]:
+                del self._waiting[chat_id]
+                del self._locks[chat_id]
+
+    def _lock(self, chat_id):
+        lock = self._locks.get(chat_id)
+        if lock is None:
+            lock = self._locks[chat_id] = asyncio.Lock()
+        return lock
+
+    def _bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= self.MAX_BUCKETS:
+                self._prune_buckets()
+            if _is_group(chat_id):
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            else:
+                bucket = TokenBucket(self.chat_rate, self.chat_burst)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    def _prune_buckets(self):
+        """Убирает ведра чатов, которые простаивают и уже полностью наполнились"""
+        now = time.monotonic()
+        for chat_id, bucket in list(self._buckets.items()):
+            if chat_id not in self._waiting and bucket.wait_time(now) == 0 and bucket.tokens >= bucket.capacity:
+                del self._buckets[chat_id]
+
+    async def _acquire(self, bucket):
+        """Ждет токен в ведре чата и в общем ведре"""
+        while True:
+            now = time.monotonic()
+            wait = max(bucket.wait_time(now), self.global_bucket.wait_time(now))
+            if wait <= 0:
+                bucket.consume()
+                self.global_bucket.consume()
+                return
+            await asyncio.sleep(wait)
+
+def _is_group(chat_id):
+    """Группы и каналы: отрицательный id или @username"""
+    try:
+        return int(chat_id) < 0
+    except (TypeError, ValueError):
+        return True
@@ -0,0 +1,489 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Хранилище статистики курильщиков (/smoke и /smokers) для SVETOBOT
+"""
+
+import bisect
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class Leaderboard:
+    """
+    Рейтинг курильщиков, который обновляется при каждом /smoke.
+    Ключи (-count, user_id) лежат в отсортированном списке: позиция ищется
+    bisect за O(log n), вставка - сдвиг списка (memmove), топ-K - срез.
+    Отрисованный текст рейтинга кэшируется, пока не изменится его топ.
+    """
+    def __init__(self, stats=None):
+        self._counts = {}
+        self._names = {}
+        self._keys = []
+        self._rendered = {}
+        
+        if stats:
+            for user_id, data in stats.items():
+                self._counts[user_id] = data["count"]
+                self._names[user_id] = data["name"]
+            self._keys = sorted((-count, user_id) for user_id, count in self._counts.items())
+    
+    def __len__(self):
+        return len(self._keys)
+    
+    def update(self, user_id, count, name):
+        """Обновляет счетчик пользователя в рейтинге"""
+        old_count = self._counts.get(user_id)
+        changed_from = len(self._keys)
+        if old_count is not None:
+            old_index = bisect.bisect_left(self._keys, (-old_count, user_id))
+            del self._keys[old_index]
+            changed_from = old_index
+        
+        new_key = (-count, user_id)
+        new_index = bisect.bisect_left(self._keys, new_key)
+        self._keys.insert(new_index, new_key)
+        self._counts[user_id] = count
+        self._names[user_id] = name
+        
+        # Сбрасываем только тексты, в чей топ попало изменение
+        changed_from = min(changed_from, new_index)
+        for limit in [limit for limit in self._rendered if changed_from < limit]:
+            del self._rendered[limit]
+    
+    def count(self, user_id):
+        """Счетчик пользователя (0, если его еще нет в рейтинге)"""
+        return self._counts.get(user_id, 0)
+    
+    def top(self, limit=10):
+        """Топ пользователей: [(user_id, {name, count}), ...]"""
+        return [
+            (user_id, {"name": self._names[user_id], "count": -neg_count})
+            for neg_count, user_id in self._keys[:limit]
+        ]
+    
+    def position(self, user_id):
+        """Место пользователя в рейтинге (с 1) или None"""
+        count = self._counts.get(user_id)
+        if count is None:
+            return None
+        return bisect.bisect_left(self._keys, (-count, user_id)) + 1
+    
+    def render(self, limit, render_func):
+        """
+        Текст топа, отрисованный render_func(top); пересчитывается только
+        после изменений в первых limit местах
+        """
+        text = self._rendered.get(limit)
+        if text is None:
+            text = self._rendered[limit] = render_func(self.top(limit))
+        return text
+
+class SQLiteSmokeStore:
+    """
+    Статистика курильщиков в SQLite (режим WAL).
+    Счетчик увеличивается атомарно (count = count + 1), рейтинг читается по индексу.
+    """
+    def __init__(self, path="smoke_stats.db", json_path="smoke_stats.json"):
+        self.path = path
+        # Соединение общее для потоков, запись защищена блокировкой
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS smoke_stats (
+                user_id TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                count INTEGER NOT NULL DEFAULT 0,
+                last_smoke TEXT NOT NULL DEFAULT ''
+            );
+            CREATE INDEX IF NOT EXISTS idx_smoke_stats_count ON smoke_stats(count DESC);
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            );
+        """)
+        
+        if json_path:
+            self._migrate_json(json_path)
+        
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, name, count FROM smoke_stats").fetchall()
+        self.leaderboard = Leaderboard({row[0]: {"name": row[1], "count": row[2]} for row in rows})
+    
+    def _migrate_json(self, json_path):
+        """
+        Однократный перенос статистики из старого smoke_stats.json
+        """
+        with self._lock:
+            migrated = self._conn.execute(
+                "SELECT value FROM meta WHERE key = 'json_migrated'"
+            ).fetchone()
+            if migrated or not os.path.exists(json_path):
+                return
+            
+            try:
+                with open(json_path, 'r', encoding='utf-8') as f:
+                    stats = json.load(f)
+            except Exception as e:
+                logger.error(f"Не удалось прочитать {json_path} для миграции: {e}")
+                return
+            
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO smoke_stats(user_id, name, count, last_smoke) VALUES (?, ?, ?, ?)",
+                    [
+                        (user_id, data.get("name", ""), data.get("count", 0), data.get("last_smoke", ""))
+                        for user_id, data in stats.items()
+                    ]
+                )
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO meta(key, value) VALUES ('json_migrated', ?)", (json_path,)
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            
+            logger.info(f"Статистика из {json_path} перенесена в {self.path}: {len(stats)} пользователей")
+    
+    def increment(self, user_id, name, last_smoke):
+        """
+        Атомарно увеличивает счетчик пользователя и возвращает новое значение
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT OR IGNORE INTO smoke_stats(user_id, name, count, last_smoke) VALUES (?, ?, 0, '')",
+                    (user_id, name)
+                )
+                self._conn.execute(
+                    "UPDATE smoke_stats SET count = count + 1, name = ?, last_smoke = ? WHERE user_id = ?",
+                    (name, last_smoke, user_id)
+                )
+                count = self._conn.execute(
+                    "SELECT count FROM smoke_stats WHERE user_id = ?", (user_id,)
+                ).fetchone()[0]
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self.leaderboard.update(user_id, count, name)
+        return count
+    
+    def get(self, user_id):
+        """Статистика пользователя или None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT name, count, last_smoke FROM smoke_stats WHERE user_id = ?", (user_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"name": row[0], "count": row[1], "last_smoke": row[2]}
+    
+    def top(self, limit=10):
+        """Топ пользователей по числу покуров: [(user_id, {name, count}), ...]"""
+        return self.leaderboard.top(limit)
+    
+    def export(self):
+        """Вся статистика: {user_id: {name, count, last_smoke}}"""
+        with self._lock:
+            rows = self._conn.execute("SELECT user_id, name, count, last_smoke FROM smoke_stats").fetchall()
+        return {row[0]: {"name": row[1], "count": row[2], "last_smoke": row[3]} for row in rows}
+    
+    def seed(self, stats):
+        """Заполняет пустое хранилище готовой статистикой"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO smoke_stats(user_id, name, count, last_smoke) VALUES (?, ?, ?, ?)",
+                    [(user_id, data["name"], data["count"], data["last_smoke"]) for user_id, data in stats.items()]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        self.leaderboard = Leaderboard(self.export())
+    
+    def close(self):
+        """Закрывает соединение с базой"""
+        with self._lock:
+            self._conn.close()
+    
+    def should_flush(self):
+        """SQLite пишет сразу - отложенной записи нет"""
+        return False
+    
+    def flush(self):
+        """Совместимость с JournalSmokeStore"""
+
+class JournalSmokeStore:
+    """
+    Статистика курильщиков в памяти.
+    Загружается один раз при старте; изменения пачками дописываются в журнал
+    (append-only), а журнал в фоне сворачивается в снимок через атомарный rename.
+    Обработчики команд работают только со словарем в памяти.
+    """
+    def __init__(self, snapshot_path="smoke_stats.json", journal_path=None,
+                 flush_every=20, compact_every=1000):
+        self.snapshot_path = snapshot_path
+        self.journal_path = journal_path or snapshot_path + ".journal"
+        self.flush_every = flush_every
+        self.compact_every = compact_every
+        
+        self._state_lock = threading.Lock()  # словарь и очередь записей
+        self._io_lock = threading.Lock()     # журнал и снимок
+        self._pending = []
+        self._journal_records = 0
+        self._damaged_journal = False
+        self.stats = self._load()
+        self.leaderboard = Leaderboard(self.stats)
+        if self._damaged_journal:
+            # Обрезанная строка в конце журнала испортила бы следующую запись
+            self._compact()
+    
+    def _load(self):
+        """Снимок + повтор журнала"""
+        stats = {}
+        if os.path.exists(self.snapshot_path):
+            try:
+                with open(self.snapshot_path, 'r', encoding='utf-8') as f:
+                    stats = json.load(f)
+            except Exception as e:
+                logger.error(f"Ошибка чтения снимка {self.snapshot_path}: {e}")
+        
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # Недописанная при падении строка - пропускаем
+                        self._damaged_journal = True
+                        continue
+                    user_id = record.pop("user_id")
+                    stats[user_id] = record
+                    self._journal_records += 1
+        
+        return stats
+    
+    def increment(self, user_id, name, last_smoke):
+        """
+        Увеличивает счетчик пользователя в памяти и возвращает новое значение
+        """
+        with self._state_lock:
+            data = self.stats.get(user_id)
+            if data is None:
+                data = self.stats[user_id] = {"name": name, "count": 0, "last_smoke": ""}
+            data["count"] += 1
+            data["name"] = name
+            data["last_smoke"] = last_smoke
+            # В журнал пишем итоговое значение - повтор записи безопасен
+            self._pending.append({"user_id": user_id, **data})
+            self.leaderboard.update(user_id, data["count"], name)
+            return data["count"]
+    
+    def get(self, user_id):
+        """Статистика пользователя или None"""
+        data = self.stats.get(user_id)
+        return dict(data) if data is not None else None
+    
+    def top(self, limit=10):
+        """Топ пользователей по числу покуров: [(user_id, {name, count}), ...]"""
+        return self.leaderboard.top(limit)
+    
+    def export(self):
+        """Вся статистика: {user_id: {name, count, last_smoke}}"""
+        with self._state_lock:
+            return {user_id: dict(data) for user_id, data in self.stats.items()}
+    
+    def seed(self, stats):
+        """Заполняет пустое хранилище готовой статистикой и сразу пишет снимок"""
+        with self._state_lock:
+            self.stats = {user_id: dict(data) for user_id, data in stats.items()}
+            self.leaderboard = Leaderboard(self.stats)
+        with self._io_lock:
+            self._compact()
+    
+    def should_flush(self):
+        """Набралось ли достаточно изменений для записи в журнал"""
+        return len(self._pending) >= self.flush_every
+    
+    def flush(self):
+        """
+        Дописывает накопленные изменения в журнал (вызывать вне event loop)
+        """
+        with self._io_lock:
+            with self._state_lock:
+                pending, self._pending = self._pending, []
+            if not pending:
+                return
+            
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                for record in pending:
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            
+            self._journal_records += len(pending)
+            if self._journal_records >= self.compact_every:
+                self._compact()
+    
+    def _compact(self):
+        """Сворачивает журнал в новый снимок"""
+        with self._state_lock:
+            snapshot = {user_id: dict(data) for user_id, data in self.stats.items()}
+        
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        
+        # Изменения после копирования остались в очереди и попадут в новый журнал
+        open(self.journal_path, 'w').close()
+        self._journal_records = 0
+    
+    def close(self):
+        """Записывает все изменения и сворачивает журнал"""
+        self.flush()
+        with self._io_lock:
+            if self._journal_records:
+                self._compact()
+
+class ChatSmokeStore:
+    """
+    Статистика курильщиков, разбитая по чатам.
+    У каждого чата свой раздел (отдельный файл со своим рейтингом), поверх
+    них - общий раздел. Разделы открываются при первом обращении и
+    закрываются, когда чат долго неактивен, поэтому память и индексы растут
+    с числом активных чатов, а не со всеми пользователями.
+    """
+    def __init__(self, open_partition, global_store, max_open=50, idle_timeout=3600, seed_chat_id=None):
+        self._open_partition = open_partition
+        self.global_store = global_store
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        # Чат, в который переносится старая общая статистика
+        self.seed_chat_id = str(seed_chat_id) if seed_chat_id else None
+        self._partitions = {}
+        self._last_used = {}
+        self._closing = {}
+        self._lock = threading.Lock()
+    
+    def cached_partition(self, chat_id):
+        """Открытый раздел чата или None (без обращения к диску)"""
+        chat_id = str(chat_id)
+        store = self._partitions.get(chat_id)
+        if store is not None:
+            self._last_used[chat_id] = time.monotonic()
+        return store
+    
+    def partition(self, chat_id):
+        """
+        Раздел чата; при первом обращении читается с диска
+        """
+        store = self.cached_partition(chat_id)
+        if store is not None:
+            return store
+        
+        chat_id = str(chat_id)
+        while True:
+            with self._lock:
+                store = self._partitions.get(chat_id)
+                if store is not None:
+                    return store
+                
+                closed = self._closing.get(chat_id)
+                if closed is None:
+                    store = self._open_partition(chat_id)
+                    if chat_id == self.seed_chat_id and not len(store.leaderboard) and len(self.global_store.leaderboard):
+                        store.seed(self.global_store.export())
+                        logger.info(f"Общая статистика перенесена в раздел чата {chat_id}")
+                    self._last_used[chat_id] = time.monotonic()
+                    self._partitions[chat_id] = store
+                    return store
+            
+            # Раздел сейчас закрывается - ждем, пока он допишет данные на диск
+            closed.wait()
+    
+    def increment(self, chat_id, user_id, name, last_smoke):
+        """
+        Увеличивает счетчики пользователя в чате и в общем разделе,
+        возвращает счетчик в чате
+        """
+        # Сначала открываем раздел: при переносе старой статистики в него
+        # копируется общий счетчик, который еще не включает этот /smoke
+        store = self.partition(chat_id)
+        self.global_store.increment(user_id, name, last_smoke)
+        return store.increment(user_id, name, last_smoke)
+    
+    def leaderboard(self, chat_id=None):
+        """Рейтинг чата или общий рейтинг (chat_id=None)"""
+        if chat_id is None:
+            return self.global_store.leaderboard
+        return self.partition(chat_id).leaderboard
+    
+    def should_flush(self):
+        """Есть ли раздел, которому пора записать изменения"""
+        if self.global_store.should_flush():
+            return True
+        return any(store.should_flush() for store in list(self._partitions.values()))
+    
+    def _take_idle(self):
+        """Забирает давно неактивные разделы и лишние сверх max_open (под блокировкой)"""
+        now = time.monotonic()
+        by_age = sorted(self._partitions, key=lambda chat_id: self._last_used.get(chat_id, 0))
+        overflow = len(by_age) - self.max_open
+        
+        evicted = []
+        for i, chat_id in enumerate(by_age):
+            if i >= overflow and now - self._last_used.get(chat_id, 0) < self.idle_timeout:
+                break
+            evicted.append((chat_id, self._partitions.pop(chat_id)))
+            self._last_used.pop(chat_id, None)
+            self._closing[chat_id] = threading.Event()
+        return evicted
+    
+    def flush(self):
+        """
+        Записывает изменения всех разделов и закрывает неактивные
+        (вызывать вне event loop)
+        """
+        self.global_store.flush()
+        
+        with self._lock:
+            evicted = self._take_idle()
+            stores = list(self._partitions.values())
+        
+        for store in stores:
+            store.flush()
+        
+        for chat_id, store in evicted:
+            try:
+                store.close()
+            finally:
+                with self._lock:
+                    self._closing.pop(chat_id).set()
+    
+    def close(self):
+        """Записывает изменения и закрывает все разделы"""
+        with self._lock:
+            stores = list(self._partitions.values())
+            self._partitions.clear()
+            self._last_used.clear()
+        
+        for store in stores:
+            store.close()
+        self.global_store.close()
@@ -4,11 +4,23 @@
 SVETOBOT - Бот для мониторинга отключений электроэнергии в Киеве
 """
 
+import asyncio
+import heapq
+import itertools
 import logging
+import os
 import re
+import string
+from collections import deque, namedtuple
 from datetime import datetime, timedelta
-import requests
-from bs4 import BeautifulSoup
+
+from power_parser import (
+    FALLBACK_SCHEDULE, KyivEnergyParser, PowerStatusCache, current_minute, format_minutes
+)
+from media_cache import MediaCache
+from rate_limiter import OutboundRateLimiter
+from smoke_store import ChatSmokeStore, JournalSmokeStore, SQLiteSmokeStore
+from update_processor import PerChatUpdateProcessor
 
 from telegram import Update
 from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
@@ -28,160 +40,213 @@ except ImportError:
     print("📝 Скопируйте config_template.py в config.py и заполните данными")
     exit(1)
 
-class KyivEnergyParser:
-    def __init__(self):
-        self.last_status = None
+# Кадр анимации: пауза перед кадром, корутина-функция и ключ.
+# Подряд идущие просроченные кадры с одним ключом схлопываются в последний
+AnimationFrame = namedtuple("AnimationFrame", ["delay", "step", "key"], defaults=[None])
+
+class AnimationScheduler:
+    """
+    Планировщик кадров анимаций в фоне: один таймер на чат.
+    Кадры одновременных анимаций одного чата, попавшие в окно merge_window,
+    отправляются одной пачкой, а отставшие правки сообщения пропускаются.
+    Кадр может вернуть список новых кадров (например, запасную анимацию),
+    исключение в кадре прерывает только его анимацию.
+    """
+    def __init__(self, merge_window=0.3):
+        self.merge_window = merge_window
+        self._timelines = {}
+        self._runners = {}
+        self._wakeups = {}
+        self._seq = itertools.count()
+        self.frames_sent = 0
+        self.frames_merged = 0
+    
+    def start(self, chat_id, frames):
+        """Запускает анимацию в чате и сразу возвращает управление"""
+        frames = deque(frames)
+        if not frames:
+            return
+        loop = asyncio.get_running_loop()
+        timeline = self._timelines.setdefault(chat_id, [])
+        heapq.heappush(timeline, (loop.time() + frames[0].delay, next(self._seq), frames))
         
-    def parse_power_status(self):
-        """
-        Парсит статус электричества с сайта energy-ua.info
-        """
+        if chat_id not in self._runners:
+            self._wakeups[chat_id] = asyncio.Event()
+            self._runners[chat_id] = loop.create_task(self._run(chat_id))
+        else:
+            # Будим таймер чата: новый кадр может быть раньше текущего ожидания
+            self._wakeups[chat_id].set()
+    
+    def active(self):
+        """Количество анимаций, которые еще не доиграли"""
+        return sum(len(timeline) for timeline in self._timelines.values())
+    
+    def stats(self):
+        """Счетчики отправленных и схлопнутых кадров"""
+        return {"active": self.active(), "sent": self.frames_sent, "merged": self.frames_merged}
+    
+    async def close(self):
+        """Останавливает все анимации"""
+        runners = list(self._runners.values())
+        for task in runners:
+            task.cancel()
+        await asyncio.gather(*runners, return_exceptions=True)
+    
+    async def _run(self, chat_id):
+        loop = asyncio.get_running_loop()
+        timeline = self._timelines[chat_id]
+        wakeup = self._wakeups[chat_id]
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/webp,*/*;q=0.8',
-                'Accept-Language': 'uk-UA,uk;q=0.8,en-US;q=0.5,en;q=0.3',
-                'Accept-Encoding': 'gzip, deflate, br',
-                'DNT': '1',
-                'Connection': 'keep-alive',
-                'Upgrade-Insecure-Requests': '1',
-            }
-            
-            # Создаем сессию для сохранения cookies
-            session = requests.Session()
-            session.headers.update(headers)
-            
-            response = session.get(Config.SITE_URL, timeout=15, allow_redirects=True)
-            response.raise_for_status()
-            
-            # Убираем лишние пробелы и переводы строк
-            content = response.text.replace('\n', ' ').replace('\r', ' ')
-            soup = BeautifulSoup(content, 'html.parser')
-            
-            # Поиск текущего статуса
-            has_power = True
-            time_left = None
-            next_outage = None
-            periods = []
-            
-            # Проверяем статус - есть ли фраза о том что свет выключен
-            text_content = soup.get_text().lower()
-            
-            if 'має бути вимкнена' in text_content or 'відсутня' in text_content:
-                has_power = False
+            while timeline:
+                delay = timeline[0][0] - loop.time()
+                if delay > 0:
+                    wakeup.clear()
+                    try:
+                        await asyncio.wait_for(wakeup.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+                    continue
                 
-                # Извлекаем время до включения
-                time_pattern = r'(\d+)год\s+(\d+)хв'
-                time_match = re.search(time_pattern, text_content)
-                if time_match:
-                    hours = int(time_match.group(1))
-                    minutes = int(time_match.group(2))
-                    time_left = f"{hours}:{minutes:02d}"
-            
-            # Ищем периоды отключений на сегодня
-            periods_text = soup.find_all(text=re.compile(r'З \d{2}:\d{2}.*до \d{2}:\d{2}'))
-            for period_match in periods_text:
-                period_clean = period_match.strip()
-                if 'З ' in period_clean and 'до ' in period_clean:
-                    # Извлекаем время начала и конца
-                    time_range_match = re.search(r'З (\d{2}:\d{2}).*до (\d{2}:\d{2})', period_clean)
-                    if time_range_match:
-                        start_time = time_range_match.group(1)
-                        end_time = time_range_match.group(2)
-                        periods.append(f"{start_time}-{end_time}")
-            
-            # Находим ближайшее отключение
-            if periods and has_power:
-                current_time = datetime.now()
-                current_hour_min = current_time.strftime("%H:%M")
-                
-                for period in periods:
-                    start_time = period.split('-')[0]
-                    if start_time > current_hour_min:
-                        next_outage = period
-                        break
+                # Забираем все кадры, которые пора показать
+                now = loop.time()
+                batch = []
+                while timeline and timeline[0][0] <= now + self.merge_window:
+                    due, _, frames = heapq.heappop(timeline)
+                    batch.append((frames, self._take_frame(frames, due, now)))
                 
-                # Если не нашли сегодня, проверяем завтра (упрощенно)
-                if not next_outage and periods:
-                    next_outage = f"завтра {periods[0]}"
-            
-            current_time = datetime.now()
-            
-            return {
-                "has_power": has_power,
-                "time_left": time_left,
-                "next_outage": next_outage,
-                "today_periods": periods[:3] if periods else [],  # Максимум 3 периода
-                "queue": "1.1",
-                "update_time": current_time.strftime("%H:%M %d.%m.%Y"),
-                "source": "energy-ua.info"
-            }
+                results = await asyncio.gather(
+                    *(frame.step() for _, frame in batch), return_exceptions=True
+                )
+                self.frames_sent += len(batch)
                 
-        except requests.RequestException as e:
-            logger.error(f"Ошибка при запросе к сайту: {e}")
-            # Возвращаем fallback данные
-            return self._get_fallback_data(f"Сайт недоступен: {e}")
-        except Exception as e:
-            logger.error(f"Ошибка парсинга: {e}")
-            return self._get_fallback_data(f"Ошибка парсинга: {e}")
-    
-    def _get_fallback_data(self, error_reason):
-        """
-        Возвращает тестовые данные когда основной сайт недоступен
-        """
-        current_time = datetime.now()
-        current_hour = current_time.hour
-        
-        # Логика отключений: 
-        # 02:30-06:30 и 13:00-17:00 - света нет
-        minute = current_time.minute
-        
-        is_night_outage = (current_hour == 2 and minute >= 30) or (3 <= current_hour <= 5) or (current_hour == 6 and minute < 30)
-        is_day_outage = 13 <= current_hour < 17
-        
-        has_power = not (is_night_outage or is_day_outage)
-        
-        if has_power:
-            next_outage = "13:00-17:00" if current_hour < 13 else "завтра 02:30-06:30"
-            time_left = None
-        else:
-            # Правильный расчет времени до включения
-            if 2 <= current_hour < 6 or (current_hour == 6 and current_time.minute < 30):
-                # Отключение до 6:30
-                target_time = current_time.replace(hour=6, minute=30, second=0, microsecond=0)
-                if current_hour >= 6:  # если уже 6+ часов, но меньше 6:30
-                    target_time = target_time
-                elif current_hour < 6:
-                    target_time = target_time
-            else:  # 13-17 часов
-                # Отключение до 17:00
-                target_time = current_time.replace(hour=17, minute=0, second=0, microsecond=0)
-            
-            time_diff = target_time - current_time
-            total_minutes = int(time_diff.total_seconds() // 60)
-            hours_left = total_minutes // 60
-            minutes_left = total_minutes % 60
-            
-            if hours_left > 0:
-                time_left = f"{hours_left}ч {minutes_left}м"
-            else:
-                time_left = f"{minutes_left}м"
-            
-            next_outage = None
-        
-        return {
-            "has_power": has_power,
-            "time_left": time_left,
-            "next_outage": next_outage,
-            "today_periods": ["02:30-06:30", "13:00-17:00"],
-            "queue": "1.1",
-            "update_time": current_time.strftime("%H:%M %d.%m.%Y"),
-            "source": f"Тестовые данные ({error_reason})",
-            "is_fallback": True
-        }
-
-# Глобальный объект парсера
-energy_parser = KyivEnergyParser()
+                now = loop.time()
+                for (frames, frame), result in zip(batch, results):
+                    if isinstance(result, Exception):
+                        logger.error(f"Ошибка кадра анимации в чате {chat_id}: {result}")
+                        continue
+                    if result:
+                        frames.extendleft(reversed(result))
+                    if frames:
+                        heapq.heappush(timeline, (now + frames[0].delay, next(self._seq), frames))
+        finally:
+            del self._timelines[chat_id]
+            del self._runners[chat_id]
+            del self._wakeups[chat_id]
+    
+    def _take_frame(self, frames, due, now):
+        """Следующий кадр анимации; устаревшие правки с тем же ключом пропускаются"""
+        frame = frames.popleft()
+        while (frame.key is not None and frames and frames[0].key == frame.key
+               and due + frames[0].delay <= now):
+            due += frames[0].delay
+            frame = frames.popleft()
+            self.frames_merged += 1
+        return frame
+
+# Глобальный объект парсера и кэш статуса
+energy_parser = KyivEnergyParser(
+    Config.SITE_URL,
+    pool_size=getattr(Config, 'HTTP_POOL_SIZE', 4),
+    retries=getattr(Config, 'HTTP_RETRIES', 2),
+    timeout=getattr(Config, 'HTTP_TIMEOUT', (5, 15)),
+    backend=getattr(Config, 'PARSER_BACKEND', 'auto'),
+    streaming=getattr(Config, 'STREAM_PARSE', False)
+)
+status_cache = PowerStatusCache(
+    energy_parser,
+    ttl=getattr(Config, 'STATUS_CACHE_TTL', Config.CHECK_INTERVAL * 60)
+)
+
+# Анимации /smoke проигрываются в фоне, не занимая обработчик
+smoke_animations = AnimationScheduler()
+
+# file_id уже загруженных GIF, чтобы Telegram не скачивал их заново
+media_cache = MediaCache(getattr(Config, 'MEDIA_CACHE_PATH', 'media_cache.json'))
+
+# Все исходящие запросы в чаты идут через лимиты Telegram
+outbound_limiter = OutboundRateLimiter(
+    global_rate=getattr(Config, 'RATE_LIMIT_GLOBAL', 30),
+    chat_rate=getattr(Config, 'RATE_LIMIT_CHAT', 1),
+    group_rate=getattr(Config, 'RATE_LIMIT_GROUP', 20 / 60)
+)
+
+# Хранилище статистики курильщиков: в памяти с журналом (по умолчанию) или SQLite.
+# Общая статистика лежит в прежнем файле, у каждого чата - свой раздел в SMOKE_CHATS_DIR
+SMOKE_CHATS_DIR = getattr(Config, 'SMOKE_CHATS_DIR', 'smoke_chats')
+os.makedirs(SMOKE_CHATS_DIR, exist_ok=True)
+
+if getattr(Config, 'SMOKE_STORAGE', 'memory') == 'sqlite':
+    global_smoke_store = SQLiteSmokeStore(getattr(Config, 'SMOKE_DB_PATH', 'smoke_stats.db'))
+    
+    def open_chat_smoke_store(chat_id):
+        return SQLiteSmokeStore(os.path.join(SMOKE_CHATS_DIR, f"{chat_id}.db"), json_path=None)
+else:
+    global_smoke_store = JournalSmokeStore(
+        getattr(Config, 'SMOKE_STATS_PATH', 'smoke_stats.json'),
+        flush_every=getattr(Config, 'SMOKE_FLUSH_EVERY', 20)
+    )
+    
+    def open_chat_smoke_store(chat_id):
+        return JournalSmokeStore(
+            os.path.join(SMOKE_CHATS_DIR, f"{chat_id}.json"),
+            flush_every=getattr(Config, 'SMOKE_FLUSH_EVERY', 20)
+        )
+
+smoke_store = ChatSmokeStore(
+    open_chat_smoke_store,
+    global_smoke_store,
+    max_open=getattr(Config, 'SMOKE_MAX_OPEN_CHATS', 50),
+    # Старая общая статистика достается основной группе
+    seed_chat_id=None if Config.CHAT_ID == "YOUR_CHAT_ID_HERE" else Config.CHAT_ID
+)
+
+async def get_chat_smoke_stats(chat_id):
+    """Раздел статистики чата; с диска читается в пуле потоков"""
+    store = smoke_store.cached_partition(chat_id)
+    if store is None:
+        loop = asyncio.get_running_loop()
+        store = await loop.run_in_executor(None, smoke_store.partition, chat_id)
+    return store
+
+async def flush_smoke_stats(context: ContextTypes.DEFAULT_TYPE):
+    """Фоновая запись накопленной статистики на диск"""
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, smoke_store.flush)
+    except Exception as e:
+        logger.error(f"Ошибка сохранения статистики: {e}")
+
+async def poll_power_status(context: ContextTypes.DEFAULT_TYPE):
+    """Фоновая проверка статуса света: прогревает кэш и сообщает об изменениях"""
+    status = await status_cache.refresh()
+    
+    # Тестовые данные не сравниваем, иначе будут ложные уведомления
+    if status.get("is_fallback"):
+        return
+    
+    previous = energy_parser.last_status
+    energy_parser.last_status = status
+    
+    if previous is None or previous["has_power"] == status["has_power"]:
+        return
+    
+    if status["has_power"]:
+        message = "🟢 Свет ДАЛИ!"
+        if status.get("next_outage"):
+            message += f"\n⏰ Следующее отключение: {status['next_outage']}"
+    else:
+        message = "🔴 Свет ОТКЛЮЧИЛИ!"
+        if status.get("time_left"):
+            message += f"\n⏳ До включения: {status['time_left']}"
+    
+    if Config.CHAT_ID == "YOUR_CHAT_ID_HERE":
+        logger.info(f"CHAT_ID не настроен, уведомление не отправлено: {message}")
+        return
+    
+    try:
+        await context.bot.send_message(chat_id=Config.CHAT_ID, text=message)
+    except Exception as e:
+        logger.error(f"Ошибка отправки уведомления: {e}")
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /start"""
@@ -203,7 +268,7 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def light_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /svet - краткий статус"""
-    status = energy_parser.parse_power_status()
+    status = await status_cache.get()
     
     if "error" in status:
         message = f"❌ Ошибка: {status['error']}"
@@ -228,24 +293,16 @@ async def light_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         # Добавляем расписание на день
         message += f"\n\n📅 **Расписание на сегодня:**\n"
         
-        # Создаем полное расписание дня
-        day_schedule = [
-            ("00:00-02:30", "🟢 Свет есть"),
-            ("02:30-06:30", "🔴 Отключение"), 
-            ("06:30-13:00", "🟢 Свет есть"),
-            ("13:00-17:00", "🔴 Отключение"),
-            ("17:00-24:00", "🟢 Свет есть")
-        ]
-        
-        current_time = datetime.now()
-        current_period = f"{current_time.hour:02d}:{current_time.minute:02d}"
+        # Полное расписание дня по отрезкам
+        schedule = status.get("schedule", FALLBACK_SCHEDULE)
+        minute = current_minute()
         
-        for time_range, description in day_schedule:
-            start_time = time_range.split('-')[0]
-            end_time = time_range.split('-')[1]
+        for start, end, is_outage in schedule.day_segments():
+            time_range = f"{format_minutes(start)}-{format_minutes(end)}"
+            description = "🔴 Отключение" if is_outage else "🟢 Свет есть"
             
             # Отмечаем текущий период
-            if _is_current_time_in_range(current_period, start_time, end_time):
+            if start <= minute < end:
                 message += f"➤ **{time_range}** - {description}\n"
             else:
                 message += f"   {time_range} - {description}\n"
@@ -254,7 +311,7 @@ async def light_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /статус - подробный статус"""
-    status = energy_parser.parse_power_status()
+    status = await status_cache.get()
     
     if "error" in status:
         message = f"❌ Ошибка получения данных:\n{status['error']}"
@@ -307,40 +364,25 @@ async def info_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def smoke_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /smoke - анимация покурили с рейтингом"""
-    import asyncio
     import random
-    import json
-    import os
-    from datetime import datetime
     
     user_id = str(update.effective_user.id)
     user_name = update.effective_user.first_name
+    chat_id = str(update.effective_chat.id)
     
-    # Загружаем статистику
-    stats_file = "smoke_stats.json"
-    try:
-        with open(stats_file, 'r', encoding='utf-8') as f:
-            stats = json.load(f)
-    except:
-        stats = {}
-    
-    # Обновляем статистику пользователя
-    if user_id not in stats:
-        stats[user_id] = {"name": user_name, "count": 0, "last_smoke": ""}
-    
-    stats[user_id]["count"] += 1
-    stats[user_id]["name"] = user_name  # Обновляем имя
-    stats[user_id]["last_smoke"] = datetime.now().strftime("%Y-%m-%d %H:%M")
-    
-    # Сохраняем статистику
+    # Атомарно обновляем статистику пользователя в чате и общую
     try:
-        with open(stats_file, 'w', encoding='utf-8') as f:
-            json.dump(stats, f, ensure_ascii=False, indent=2)
+        chat_stats = await get_chat_smoke_stats(chat_id)
+        smoke_count = smoke_store.increment(chat_id, user_id, user_name, datetime.now().strftime("%Y-%m-%d %H:%M"))
     except Exception as e:
         logger.error(f"Ошибка сохранения статистики: {e}")
+        await update.message.reply_text("❌ Не удалось сохранить статистику, попробуйте позже")
+        return
+    
+    if smoke_store.should_flush():
+        context.application.create_task(flush_smoke_stats(context))
     
     # Определяем ранг и уровень
-    smoke_count = stats[user_id]["count"]
     rank_info = get_smoke_rank(smoke_count)
     
     # Случайные фразы для разнообразия
@@ -381,9 +423,6 @@ async def smoke_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     
     chosen_phrase = random.choice(smoke_phrases)
     
-    # Отправляем начальное сообщение
-    message = await update.message.reply_text(chosen_phrase)
-    
     # Выбираем тип анимации в зависимости от ранга
     animation_type = "emoji"  # По умолчанию эмодзи
     
@@ -392,82 +431,123 @@ async def smoke_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     elif smoke_count >= 5:   # Стикеры для средних рангов
         animation_type = random.choice(["sticker", "emoji"])
     
-    if animation_type == "gif":
+    # Кадры анимации проигрывает планировщик в фоне, обработчик сразу освобождается
+    sent = {}
+    
+    async def send_phrase():
+        # Отправляем начальное сообщение
+        sent["message"] = await update.message.reply_text(chosen_phrase)
+    
+    async def send_gif():
         # Отправляем GIF анимацию
-        await asyncio.sleep(1)
         try:
             gif_url = random.choice(weed_gifs)
-            await update.message.reply_animation(animation=gif_url, 
-                                               caption=f"🌿 {user_name} в процессе... 💨")
+            await reply_cached_animation(update.message, gif_url,
+                                         caption=f"🌿 {user_name} в процессе... 💨")
         except Exception as e:
             logger.error(f"Ошибка отправки GIF: {e}")
-            animation_type = "emoji"  # Fallback
+            return emoji_frames()  # Fallback
     
-    elif animation_type == "sticker":
+    async def send_sticker():
         # Отправляем тематический "стикер"
-        await asyncio.sleep(1)
         try:
             sticker_emoji = random.choice(weed_stickers)
             await update.message.reply_text(f"{sticker_emoji}\n{user_name} курит как профи!")
         except Exception as e:
-            animation_type = "emoji"  # Fallback
+            logger.warning(f"Ошибка отправки стикера: {e}")
+            return emoji_frames()  # Fallback
     
-    if animation_type == "emoji":
+    def emoji_frames():
         # Анимируем смайлики (улучшенная версия)
         chosen_animation = random.choice(animations)
         sleep_time = 1.5 if smoke_count <= 10 else 1.2 if smoke_count <= 50 else 1.0
+        return [
+            AnimationFrame(sleep_time, show_emoji(i, emoji, len(chosen_animation)), key="emoji")
+            for i, emoji in enumerate(chosen_animation)
+        ]
+    
+    def show_emoji(i, emoji, total):
+        async def step():
+            try:
+                progress = "▓" * (i + 1) + "░" * (total - i - 1)
+                await sent["message"].edit_text(f"{chosen_phrase}\n\n{emoji}\n\n[{progress}]")
+            except Exception as e:
+                logger.warning(f"Кадр анимации не отправлен: {e}")
+        return step
+    
+    async def send_rank():
+        # Финальное сообщение с рангом
+        final_messages = [
+            f"✨ {user_name} покурил и вернулся!",
+            f"😌 {user_name} расслабился...",
+            f"🌈 {user_name} в хорошем настроении!",
+            f"🧘‍♂️ {user_name} достиг просветления...",
+            f"💫 {user_name} теперь в космосе...",
+            f"🎯 {user_name} попал в десятку!",
+            f"🔥 {user_name} зажег как надо!",
+            f"🌟 {user_name} сияет как звезда!",
+            f"😎 {user_name} крутой как огурец!",
+            f"🚀 {user_name} улетел в стратосферу!"
+        ]
         
-        for i, emoji in enumerate(chosen_animation):
-            await asyncio.sleep(sleep_time)
+        rank_message = f"{random.choice(final_messages)}\n\n{rank_info['icon']} **Ваш ранг:** {rank_info['title']}\n📊 Покуров: {smoke_count}"
+        
+        position = chat_stats.leaderboard.position(user_id)
+        if position:
+            rank_message += f"\n🏅 Место в рейтинге: {position}"
+        
+        # Проверяем повышение в ранге
+        if smoke_count in [1, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100]:
+            rank_message += f"\n🎉 **ПОВЫШЕНИЕ!** Новый ранг разблокирован!"
+            # Отправляем праздничную анимацию
             try:
-                progress = "▓" * (i + 1) + "░" * (len(chosen_animation) - i - 1)
-                await message.edit_text(f"{chosen_phrase}\n\n{emoji}\n\n[{progress}]")
-            except:
-                pass
-    
-    # Финальное сообщение с рангом
-    await asyncio.sleep(2)
-    
-    final_messages = [
-        f"✨ {user_name} покурил и вернулся!",
-        f"😌 {user_name} расслабился...",
-        f"🌈 {user_name} в хорошем настроении!",
-        f"🧘‍♂️ {user_name} достиг просветления...",
-        f"💫 {user_name} теперь в космосе...",
-        f"🎯 {user_name} попал в десятку!",
-        f"🔥 {user_name} зажег как надо!",
-        f"🌟 {user_name} сияет как звезда!",
-        f"😎 {user_name} крутой как огурец!",
-        f"🚀 {user_name} улетел в стратосферу!"
-    ]
+                await update.message.reply_text("🎆🎉🏆 ПОЗДРАВЛЯЕМ! 🏆🎉🎆\n🌟 Достигнут новый уровень! 🌟")
+            except Exception as e:
+                logger.warning(f"Поздравление не отправлено: {e}")
+        
+        # Добавляем мотивационное сообщение
+        if smoke_count % 5 == 0 and smoke_count > 1:
+            motivational = [
+                f"🔥 Уже {smoke_count} раз! Ты на верном пути!",
+                f"💨 {smoke_count} покуров - это серьезно!",
+                f"🌿 {smoke_count} сеансов релакса за плечами!",
+                f"✨ {smoke_count} путешествий в космос!",
+                f"🎯 {smoke_count} точных попаданий!",
+                f"🌟 {smoke_count} звездных моментов!"
+            ]
+            rank_message += f"\n💬 {random.choice(motivational)}"
+        
+        try:
+            await sent["message"].edit_text(rank_message, parse_mode='Markdown')
+        except Exception:
+            await update.message.reply_text(rank_message, parse_mode='Markdown')
     
-    rank_message = f"{random.choice(final_messages)}\n\n{rank_info['icon']} **Ваш ранг:** {rank_info['title']}\n📊 Покуров: {smoke_count}"
+    frames = [AnimationFrame(0, send_phrase)]
+    if animation_type == "gif":
+        frames.append(AnimationFrame(1, send_gif))
+    elif animation_type == "sticker":
+        frames.append(AnimationFrame(1, send_sticker))
+    else:
+        frames.extend(emoji_frames())
+    frames.append(AnimationFrame(2, send_rank))
     
-    # Проверяем повышение в ранге
-    if smoke_count in [1, 10, 20, 30, 40, 50, 60, 70, 80, 90, 100]:
-        rank_message += f"\n🎉 **ПОВЫШЕНИЕ!** Новый ранг разблокирован!"
-        # Отправляем праздничную анимацию
+    smoke_animations.start(chat_id, frames)
+
+async def reply_cached_animation(message, url, caption):
+    """Отправляет анимацию по file_id из кэша, а при первой отправке - по URL"""
+    file_id = media_cache.get(url)
+    if file_id:
         try:
-            await update.message.reply_text("🎆🎉🏆 ПОЗДРАВЛЯЕМ! 🏆🎉🎆\n🌟 Достигнут новый уровень! 🌟")
-        except:
-            pass
-    
-    # Добавляем мотивационное сообщение
-    if smoke_count % 5 == 0 and smoke_count > 1:
-        motivational = [
-            f"🔥 Уже {smoke_count} раз! Ты на верном пути!",
-            f"💨 {smoke_count} покуров - это серьезно!",
-            f"🌿 {smoke_count} сеансов релакса за плечами!",
-            f"✨ {smoke_count} путешествий в космос!",
-            f"🎯 {smoke_count} точных попаданий!",
-            f"🌟 {smoke_count} звездных моментов!"
-        ]
-        rank_message += f"\n💬 {random.choice(motivational)}"
-    
-    try:
-        await message.edit_text(rank_message, parse_mode='Markdown')
-    except:
-        await update.message.reply_text(rank_message, parse_mode='Markdown')
+            return await message.reply_animation(animation=file_id, caption=caption)
+        except Exception as e:
+            logger.warning(f"file_id для {url} не сработал, отправляем по URL: {e}")
+            media_cache.invalidate(url)
+    
+    sent = await message.reply_animation(animation=url, caption=caption)
+    media = sent.animation or sent.document
+    if media:
+        media_cache.set(url, media.file_id)
+    return sent
 
 def get_smoke_rank(count):
     """Возвращает информацию о ранге курильщика"""
@@ -499,26 +579,38 @@ def get_smoke_rank(count):
         return {"title": "Божество дыма", "icon": "🌟"}
 
 async def smokers_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Команда /smokers - рейтинг курильщиков"""
-    import json
+    """Команда /smokers - рейтинг курильщиков чата, /smokers all - общий"""
+    show_global = bool(context.args) and context.args[0].lower() in ('all', 'global', 'все')
     
-    try:
-        with open("smoke_stats.json", 'r', encoding='utf-8') as f:
-            stats = json.load(f)
-    except:
-        await update.message.reply_text("📊 Статистика пока пуста. Используйте /smoke чтобы начать!")
-        return
+    if show_global:
+        leaderboard = smoke_store.leaderboard()
+        render = _render_global_smokers
+    else:
+        leaderboard = (await get_chat_smoke_stats(update.effective_chat.id)).leaderboard
+        render = _render_smokers
     
-    if not stats:
+    if not len(leaderboard):
         await update.message.reply_text("📊 Статистика пока пуста. Используйте /smoke чтобы начать!")
         return
     
-    # Сортируем по количеству покуров
-    sorted_users = sorted(stats.items(), key=lambda x: x[1]["count"], reverse=True)
+    # Топ 10 берется из индекса рейтинга, текст пересчитывается только при изменениях
+    message = leaderboard.render(10, render)
     
-    message = "🏆 **РЕЙТИНГ КУРИЛЬЩИКОВ**\n\n"
+    position = leaderboard.position(str(update.effective_user.id))
+    if position:
+        message += f"\n📍 Ваше место: {position} из {len(leaderboard)}"
     
-    for i, (user_id, data) in enumerate(sorted_users[:10]):  # Топ 10
+    await update.message.reply_text(message, parse_mode='Markdown')
+
+def _render_global_smokers(top_users):
+    """Текст общего рейтинга по всем чатам"""
+    return _render_smokers(top_users, title="🌍 **ОБЩИЙ РЕЙТИНГ КУРИЛЬЩИКОВ**")
+
+def _render_smokers(top_users, title="🏆 **РЕЙТИНГ КУРИЛЬЩИКОВ**"):
+    """Текст рейтинга курильщиков для /smokers"""
+    message = f"{title}\n\n"
+    
+    for i, (user_id, data) in enumerate(top_users):
         rank_info = get_smoke_rank(data["count"])
         position = "🥇" if i == 0 else "🥈" if i == 1 else "🥉" if i == 2 else f"{i+1}."
         
@@ -545,7 +637,7 @@ async def smokers_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     for count, title in ranks:
         message += f"• {title} ({count}+ покуров)\n"
     
-    await update.message.reply_text(message, parse_mode='Markdown')
+    return message
 
 async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /помощь"""
@@ -556,7 +648,8 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "/status - подробная информация 📊\n" 
         "/info - информация о чате 🔍\n"
         "/smoke - покурить косячок 🌿💨\n"
-        "/smokers - рейтинг курильщиков 🏆\n"
+        "/smokers - рейтинг курильщиков чата 🏆\n"
+        "/smokers all - общий рейтинг 🌍\n"
         "/help - эта справка 📖\n\n"
         "💬 **Можно писать словами:**\n"
         "• 'свет' или 'электричество' → статус\n"
@@ -565,45 +658,114 @@ async def help_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
         "🏠 **Адрес:** Киев, вул. Гмирі Бориса 14-А\n"
         "🔢 **Очередь:** 1.1\n"
         "🌐 **Источник:** energy-ua.info\n\n"
-        "🔄 В будущем: автоматические уведомления при изменениях!"
+        "🔔 Об отключениях и включении света пишу в группу автоматически!"
     )
     await update.message.reply_text(help_text, parse_mode='Markdown')
 
+# Ключевые слова для текстовых сообщений: маршрут -> (основа, окончания...) RU/UK.
+# Порядок маршрутов - приоритет, если в сообщении есть слова нескольких
+TEXT_ROUTES = [
+    ("light", [("свет", "", "а", "у", "ом", "е"), ("світл", "о", "а", "у", "ом", "і"),
+               ("электричеств", "о", "а", "у", "ом", "е"), ("електрик", "а", "и", "у", "ою"),
+               ("ток", "", "а", "у", "ом", "е"), ("струм", "", "у", "ом")]),
+    ("status", [("статус", "", "а", "у", "ом", "е"), ("состояни", "е", "я", "ю", "ем"), ("як справи",)]),
+    ("smoke", [("курить",), ("покурить",), ("покур", "им", "ю", "ити", "имо"), ("курнуть",),
+               ("перекур", "", "а", "у", "чик"), ("дымить",), ("подымить",),
+               ("косяк", "", "а", "у", "и", "ом"), ("травк", "у", "а", "и", "ой", "ою"), ("smoke",)]),
+    ("rating", [("рейтинг", "", "а", "у", "ом", "е", "и"), ("топ", "", "а", "у", "е"), ("rating",),
+                ("курильщик", "и", "ов", "ам", "а"), ("курц", "і", "ів", "ям")]),
+    ("help", [("помощ", "ь", "и"), ("допомог", "а", "и", "у", "ою"), ("help",)]),
+]
+
+def _build_text_routes(routes):
+    """Все формы слов -> маршрут; у фраз ключ - последнее слово, фраза сверяется отдельно"""
+    words = {}
+    phrases = {}
+    for route, stems in routes:
+        for stem, *endings in stems:
+            for ending in endings or [""]:
+                form = stem + ending
+                last_word = form.rsplit(" ", 1)[-1]
+                words[last_word] = route
+                if last_word != form:
+                    phrases[last_word] = form
+    return words, phrases
+
+TEXT_ROUTE_WORDS, TEXT_ROUTE_PHRASES = _build_text_routes(TEXT_ROUTES)
+TEXT_ROUTE_PRIORITY = {name: i for i, (name, _) in enumerate(TEXT_ROUTES)}
+TEXT_WORD_RE = re.compile(r"\w+")
+# Знаки препинания по краям слова ('свет?', '«топ»'); без '_' - он часть \w
+TEXT_EDGE_PUNCTUATION = string.punctuation.replace("_", "") + "«»…—–“”„’"
+
+def route_text(text):
+    """
+    Маршрут для текста сообщения или None.
+    Слова текста пересекаются с множеством всех форм ключевых слов -
+    сравниваются только целые слова ('востока' не срабатывает на 'ток').
+    Текст режется str.split(); у слов со знаками препинания по краям
+    ('свет?') знаки срезаются, и только склеенные слова ('свет,ток')
+    режутся регуляркой - обычное сообщение не проходит через нее вовсе.
+    """
+    text = text.lower()
+    words = text.split()
+    found = TEXT_ROUTE_WORDS.keys() & words
+    for word in words:
+        if word.isalnum():
+            continue
+        stripped = word.strip(TEXT_EDGE_PUNCTUATION)
+        if stripped.isalnum():
+            if stripped in TEXT_ROUTE_WORDS:
+                found.add(stripped)
+        else:
+            found.update(TEXT_ROUTE_WORDS.keys() & TEXT_WORD_RE.findall(word))
+    
+    best = None
+    for word in found:
+        phrase = TEXT_ROUTE_PHRASES.get(word)
+        if phrase and phrase not in text:
+            continue
+        route = TEXT_ROUTE_WORDS[word]
+        if best is None or TEXT_ROUTE_PRIORITY[route] < TEXT_ROUTE_PRIORITY[best]:
+            best = route
+    return best
+
 async def handle_text(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Обработка текстовых сообщений"""
-    text = update.message.text.lower()
-    
     # Реагируем на ключевые слова
-    if any(word in text for word in ['свет', 'электричество', 'ток', 'света']):
+    route = route_text(update.message.text)
+    if route == "light":
         await light_command(update, context)
-    elif any(word in text for word in ['статус', 'состояние', 'як справи']):
+    elif route == "status":
         await status_command(update, context)
-    elif any(word in text for word in ['курить', 'покурить', 'дымить', 'косяк', 'травку', 'smoke']):
+    elif route == "smoke":
         await smoke_command(update, context)
-    elif any(word in text for word in ['рейтинг', 'топ', 'rating', 'курильщики']):
+    elif route == "rating":
         await smokers_command(update, context)
-    elif 'помощь' in text or 'help' in text:
+    elif route == "help":
         await help_command(update, context)
 
-def _is_current_time_in_range(current_time, start_time, end_time):
-    """Проверяет, находится ли текущее время в заданном диапазоне"""
-    try:
-        current_minutes = _time_to_minutes(current_time)
-        start_minutes = _time_to_minutes(start_time)
-        end_minutes = _time_to_minutes(end_time)
-        
-        # Обработка перехода через полночь
-        if end_time == "24:00":
-            end_minutes = 24 * 60
-            
-        return start_minutes <= current_minutes < end_minutes
-    except:
-        return False
+async def stop_animations(application):
+    """Останавливает недоигранные анимации при выключении бота"""
+    await smoke_animations.close()
+    logger.info(f"Исходящие запросы: {outbound_limiter.stats()}")
 
-def _time_to_minutes(time_str):
-    """Конвертирует время HH:MM в минуты с начала дня"""
-    hours, minutes = map(int, time_str.split(':'))
-    return hours * 60 + minutes
+def run_webhook(application, webhook_url):
+    """Запуск в режиме webhook: Telegram сам присылает обновления на встроенный сервер"""
+    url_path = getattr(Config, 'WEBHOOK_PATH', 'telegram').strip('/')
+    secret_token = getattr(Config, 'WEBHOOK_SECRET', None)
+    if not secret_token:
+        logger.warning("WEBHOOK_SECRET не задан: webhook примет запрос от кого угодно")
+    
+    logger.info(f"Режим webhook: {webhook_url.rstrip('/')}/{url_path}")
+    application.run_webhook(
+        listen=getattr(Config, 'WEBHOOK_LISTEN', '0.0.0.0'),
+        port=getattr(Config, 'WEBHOOK_PORT', 8443),
+        url_path=url_path,
+        webhook_url=f"{webhook_url.rstrip('/')}/{url_path}",
+        secret_token=secret_token,
+        max_connections=getattr(Config, 'WEBHOOK_MAX_CONNECTIONS', 40),
+        allowed_updates=Update.ALL_TYPES
+    )
 
 def main():
     """Главная функция"""
@@ -617,7 +779,18 @@ def main():
     print(f"🌐 Сайт: energy-ua.info")
     
     # Создаем приложение
-    application = Application.builder().token(Config.BOT_TOKEN).build()
+    builder = (
+        Application.builder()
+        .token(Config.BOT_TOKEN)
+        .rate_limiter(outbound_limiter)
+        .concurrent_updates(PerChatUpdateProcessor(getattr(Config, 'CONCURRENT_UPDATES', 8)))
+        .post_shutdown(stop_animations)
+    )
+    # Свой Bot API сервер (или фейковый Telegram для локальной проверки)
+    api_url = getattr(Config, 'TELEGRAM_API_URL', None)
+    if api_url:
+        builder = builder.base_url(api_url)
+    application = builder.build()
     
     # Добавляем обработчики команд (только латиница!)
     application.add_handler(CommandHandler("start", start_command))
@@ -636,14 +809,38 @@ def main():
     # Обработчик текстовых сообщений
     application.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_text))
     
+    # Фоновая проверка статуса света каждые CHECK_INTERVAL минут
+    if application.job_queue:
+        application.job_queue.run_repeating(
+            poll_power_status,
+            interval=Config.CHECK_INTERVAL * 60,
+            first=0,
+            name="power_status_poll"
+        )
+        # Отложенная запись статистики /smoke
+        application.job_queue.run_repeating(
+            flush_smoke_stats,
+            interval=getattr(Config, 'SMOKE_FLUSH_INTERVAL', 5),
+            name="smoke_stats_flush"
+        )
+    else:
+        logger.warning("JobQueue недоступен: установите python-telegram-bot[job-queue]")
+    
     # Запуск бота
     print("🟢 СветБот запущен! Попробуйте /свет")
     logger.info("СветБот запущен")
     
     try:
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        webhook_url = getattr(Config, 'WEBHOOK_URL', None)
+        if webhook_url:
+            run_webhook(application, webhook_url)
+        else:
+            application.run_polling(allowed_updates=Update.ALL_TYPES)
     except KeyboardInterrupt:
         print("\n🛑 СветБот остановлен")
+    finally:
+        energy_parser.close()
+        smoke_store.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -10,13 +10,12 @@ import logging
 import json
 import os
 from datetime import datetime
-import requests
-from bs4 import BeautifulSoup
-import time
 import random
 
+from power_parser import FALLBACK_SCHEDULE, KyivEnergyParser, PowerStatusCache, current_minute, format_minutes
+
 from telegram import Update
-from telegram.ext import Application, CommandHandler, ContextTypes, MessageHandler, filters
+from telegram.ext import Application, CommandHandler, ContextTypes
 
 # Настройка логирования
 logging.basicConfig(
@@ -62,80 +61,9 @@ def get_smoke_rank(count):
     else:
         return {"title": "Божество дыма", "icon": "🌟"}
 
-class EnergyParser:
-    def __init__(self):
-        self.last_status = None
-        
-    def parse_power_status(self):
-        """Парсит статус электричества или возвращает тестовые данные"""
-        try:
-            # Пытаемся получить данные с сайта
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'
-            }
-            response = requests.get(Config.SITE_URL, headers=headers, timeout=10)
-            
-            if response.status_code == 200:
-                soup = BeautifulSoup(response.text, 'html.parser')
-                text_content = soup.get_text().lower()
-                
-                has_power = 'має бути вимкнена' not in text_content
-                
-                return {
-                    "has_power": has_power,
-                    "queue": "1.1",
-                    "update_time": datetime.now().strftime("%H:%M %d.%m.%Y"),
-                    "source": "energy-ua.info"
-                }
-            else:
-                raise Exception("Site unavailable")
-                
-        except Exception as e:
-            logger.warning(f"Using fallback data: {e}")
-            return self._get_fallback_data()
-    
-    def _get_fallback_data(self):
-        """Возвращает тестовые данные"""
-        current_time = datetime.now()
-        current_hour = current_time.hour
-        
-        # Логика отключений: 02:30-06:30 и 13:00-17:00
-        is_night_outage = (current_hour >= 2 and current_hour < 6) or (current_hour == 6 and current_time.minute < 30)
-        is_day_outage = 13 <= current_hour < 17
-        
-        has_power = not (is_night_outage or is_day_outage)
-        
-        return {
-            "has_power": has_power,
-            "today_periods": ["02:30-06:30", "13:00-17:00"],
-            "queue": "1.1",
-            "update_time": current_time.strftime("%H:%M %d.%m.%Y"),
-            "source": "PythonAnywhere тестовые данные",
-            "is_fallback": True
-        }
-
-def _is_current_time_in_range(current_time, start_time, end_time):
-    """Проверяет, находится ли текущее время в заданном диапазоне"""
-    try:
-        current_minutes = _time_to_minutes(current_time)
-        start_minutes = _time_to_minutes(start_time)
-        end_minutes = _time_to_minutes(end_time)
-        
-        # Обработка перехода через полночь
-        if end_time == "24:00":
-            end_minutes = 24 * 60
-            
-        return start_minutes <= current_minutes < end_minutes
-    except:
-        return False
-
-def _time_to_minutes(time_str):
-    """Конвертирует время HH:MM в минуты с начала дня"""
-    hours, minutes = map(int, time_str.split(':'))
-    return hours * 60 + minutes
-
 # Глобальные объекты
-energy_parser = EnergyParser()
+energy_parser = KyivEnergyParser(Config.SITE_URL)
+status_cache = PowerStatusCache(energy_parser, ttl=Config.CHECK_INTERVAL * 60)
 
 async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /start"""
@@ -156,74 +84,38 @@ async def start_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def light_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /svet"""
-    status = energy_parser.parse_power_status()
+    status = await status_cache.get()
     
     if status["has_power"]:
         emoji = "🟢"
         status_text = "РАБОТАЕТ"
         
-        # Определяем следующее отключение
-        current_time = datetime.now()
-        current_hour = current_time.hour
-        
-        if current_hour < 2 or (current_hour == 2 and current_time.minute < 30):
-            next_outage = "02:30-06:30"
-        elif current_hour < 13:
-            next_outage = "13:00-17:00"
+        if status.get("next_outage"):
+            message = f"{emoji} Свет {status_text}\n⏰ Следующее отключение: {status['next_outage']}"
         else:
-            next_outage = "завтра 02:30-06:30"
-        
-        message = f"{emoji} Свет {status_text}\n⏰ Следующее отключение: {next_outage}"
+            message = f"{emoji} Свет {status_text}\n✨ Пока отключений не планируется"
     else:
         emoji = "🔴"
         status_text = "НЕ РАБОТАЕТ"
         
-        # Вычисляем время до включения
-        current_time = datetime.now()
-        current_hour = current_time.hour
-        
-        if 2 <= current_hour < 6 or (current_hour == 6 and current_time.minute < 30):
-            # Отключение до 6:30
-            target_time = current_time.replace(hour=6, minute=30, second=0, microsecond=0)
-            if current_hour >= 6:
-                target_time = target_time
-        else:  # 13-17 часов
-            # Отключение до 17:00
-            target_time = current_time.replace(hour=17, minute=0, second=0, microsecond=0)
-        
-        time_diff = target_time - current_time
-        total_minutes = int(time_diff.total_seconds() // 60)
-        hours_left = total_minutes // 60
-        minutes_left = total_minutes % 60
-        
-        if hours_left > 0:
-            time_left = f"{hours_left}ч {minutes_left}м"
+        if status.get("time_left"):
+            message = f"{emoji} Свет {status_text}\n⏳ До включения: {status['time_left']}"
         else:
-            time_left = f"{minutes_left}м"
-        
-        message = f"{emoji} Свет {status_text}\n⏳ До включения: {time_left}"
+            message = f"{emoji} Свет {status_text}\n❓ Время включения уточняется"
     
     # Добавляем расписание на день
     message += f"\n\n📅 **Расписание на сегодня:**\n"
     
-    # Создаем полное расписание дня
-    day_schedule = [
-        ("00:00-02:30", "🟢 Свет есть"),
-        ("02:30-06:30", "🔴 Отключение"), 
-        ("06:30-13:00", "🟢 Свет есть"),
-        ("13:00-17:00", "🔴 Отключение"),
-        ("17:00-24:00", "🟢 Свет есть")
-    ]
+    # Полное расписание дня по отрезкам
+    schedule = status.get("schedule", FALLBACK_SCHEDULE)
+    minute = current_minute()
     
-    current_time = datetime.now()
-    current_period = f"{current_time.hour:02d}:{current_time.minute:02d}"
-    
-    for time_range, description in day_schedule:
-        start_time = time_range.split('-')[0]
-        end_time = time_range.split('-')[1]
+    for start, end, is_outage in schedule.day_segments():
+        time_range = f"{format_minutes(start)}-{format_minutes(end)}"
+        description = "🔴 Отключение" if is_outage else "🟢 Свет есть"
         
         # Отмечаем текущий период
-        if _is_current_time_in_range(current_period, start_time, end_time):
+        if start <= minute < end:
             message += f"➤ **{time_range}** - {description}\n"
         else:
             message += f"   {time_range} - {description}\n"
@@ -370,7 +262,7 @@ async def smokers_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Команда /status"""
-    status = energy_parser.parse_power_status()
+    status = await status_cache.get()
     
     message = "🤖 **СветБот на PythonAnywhere**\n\n"
     message += f"⚡ Мониторинг света: Активен\n"
@@ -426,7 +318,10 @@ def main():
     logger.info("СветБот запущен на PythonAnywhere")
     
     # Запускаем в режиме polling (подходит для PythonAnywhere)
-    application.run_polling(allowed_updates=Update.ALL_TYPES)
+    try:
+        application.run_polling(allowed_updates=Update.ALL_TYPES)
+    finally:
+        energy_parser.close()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Общая настройка тестов: пути к модулям бота и config.py из шаблона
+"""
+
+import os
+import sys
+import tempfile
+import types
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(ROOT_DIR, 'tests', 'fixtures')
+
+# Корень раньше netlify/functions: там свой svetbot.py (точка входа Netlify)
+sys.path[:0] = [ROOT_DIR, os.path.join(ROOT_DIR, 'netlify', 'functions')]
+os.environ.setdefault('BOT_TOKEN', 'test-token')
+
+# svetbot.py читает config.py при импорте. Берем шаблон, а файлы статистики
+# и кэша медиа кладем во временную папку, чтобы не трогать рабочие
+import config_template
+
+DATA_DIR = tempfile.mkdtemp(prefix='svetbot-tests-')
+
+class Config(config_template.Config):
+    SMOKE_STATS_PATH = os.path.join(DATA_DIR, 'smoke_stats.json')
+    SMOKE_CHATS_DIR = os.path.join(DATA_DIR, 'smoke_chats')
+    MEDIA_CACHE_PATH = os.path.join(DATA_DIR, 'media_cache.json')
+
+sys.modules['config'] = types.SimpleNamespace(Config=Config)
+
+class FakeKVResponse:
+    def __init__(self, results):
+        self.results = results
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self.results
+
+class FakeKVSession:
+    """
+    Замена requests.Session для REST API в стиле Upstash (/pipeline, /multi-exec):
+    команды Redis, которыми пользуется netlify/functions/bot.py, над словарем
+    """
+    def __init__(self):
+        self.data = {}
+        self.calls = []
+
+    def post(self, url, json=None, headers=None, timeout=None):
+        self.calls.append((url.rsplit('/', 1)[-1], json))
+        return FakeKVResponse([{"result": self.command(*command)} for command in json])
+
+    def command(self, name, key, *args):
+        # DEL совпадает с ключевым словом Python
+        handler = getattr(self, 'delete' if name == 'DEL' else name.lower())
+        return handler(key, *[str(arg) for arg in args])
+
+    def zincrby(self, key, amount, member):
+        board = self.data.setdefault(key, {})
+        board[member] = board.get(member, 0) + float(amount)
+        return str(board[member])
+
+    def _ranked(self, key):
+        board = self.data.get(key, {})
+        return sorted(board, key=lambda member: (-board[member], member))
+
+    def zcard(self, key):
+        return len(self.data.get(key, {}))
+
+    def zrevrange(self, key, start, stop, *options):
+        members = self._ranked(key)[int(start):int(stop) + 1]
+        flat = []
+        for member in members:
+            flat += [member, str(self.data[key][member])]
+        return flat
+
+    def zrevrank(self, key, member):
+        members = self._ranked(key)
+        return members.index(member) if member in members else None
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = value
+        return 1
+
+    def hmget(self, key, *fields):
+        return [self.data.get(key, {}).get(field) for field in fields]
+
+    def hincrby(self, key, field, amount):
+        values = self.data.setdefault(key, {})
+        values[field] = int(values.get(field, 0)) + int(amount)
+        return values[field]
+
+    def hdel(self, key, field):
+        return int(self.data.get(key, {}).pop(field, None) is not None)
+
+    def set(self, key, value, *options):
+        if "NX" in options and key in self.data:
+            return None
+        self.data[key] = value
+        return "OK"
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def delete(self, key):
+        return int(self.data.pop(key, None) is not None)
+
+    def rpush(self, key, value):
+        self.data.setdefault(key, []).append(value)
+        return len(self.data[key])
+
+    def lrange(self, key, start, stop):
+        values = self.data.get(key, [])
+        stop = int(stop)
+        return values[int(start):None if stop == -1 else stop + 1]
+
+    def lrem(self, key, count, value):
+        values = self.data.get(key, [])
+        if value in values:
+            values.remove(value)
+            return 1
+        return 0
+
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Медленная загрузка страницы в /svet не должна задерживать другие команды
+"""
+
+import asyncio
+import time
+from types import SimpleNamespace
+
+import svetbot
+from power_parser import PowerStatusCache
+
+SLOW_FETCH = 1.0
+
+class FakeMessage:
+    def __init__(self, replies):
+        self.replies = replies
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append((time.monotonic(), text))
+        return FakeMessage(self.replies)
+
+    async def reply_animation(self, animation, **kwargs):
+        self.replies.append((time.monotonic(), animation))
+        return FakeMessage(self.replies)
+
+    async def edit_text(self, text, **kwargs):
+        pass
+
+def make_update(chat_id, user_id, replies):
+    return SimpleNamespace(
+        message=FakeMessage(replies),
+        effective_user=SimpleNamespace(id=user_id, first_name=f"user{user_id}"),
+        effective_chat=SimpleNamespace(id=chat_id, type='group')
+    )
+
+def test_smoke_replies_while_svet_fetch_in_flight(monkeypatch):
+    def slow_parse():
+        time.sleep(SLOW_FETCH)
+        return svetbot.energy_parser._get_fallback_data("тест")
+
+    monkeypatch.setattr(svetbot.energy_parser, 'parse_power_status', slow_parse)
+    monkeypatch.setattr(svetbot, 'status_cache', PowerStatusCache(svetbot.energy_parser, ttl=60))
+    context = SimpleNamespace(application=SimpleNamespace(create_task=asyncio.ensure_future))
+
+    async def scenario():
+        svet_replies, smoke_replies = [], []
+        started = time.monotonic()
+        svet = asyncio.ensure_future(svetbot.light_command(make_update(-100, 1, svet_replies), context))
+        await asyncio.sleep(0.05)
+
+        await svetbot.smoke_command(make_update(-200, 2, smoke_replies), context)
+        while not smoke_replies and time.monotonic() - started < SLOW_FETCH:
+            await asyncio.sleep(0.01)
+
+        assert smoke_replies, "/smoke не ответил, пока /svet ждал сайт"
+        assert not svet.done()
+
+        await svet
+        await svetbot.smoke_animations.close()
+        return started, svet_replies, smoke_replies
+
+    started, svet_replies, smoke_replies = asyncio.run(scenario())
+    assert smoke_replies[0][0] - started < SLOW_FETCH / 2
+    assert svet_replies[0][0] - started >= SLOW_FETCH
+    assert smoke_replies[0][0] < svet_replies[0][0]
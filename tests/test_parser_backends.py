@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Все движки разбора страницы дают одинаковый результат на сохраненных страницах
+"""
+
+import codecs
+import os
+
+import pytest
+
+from conftest import FIXTURES_DIR
+from power_parser import PARSER_BACKENDS, KyivEnergyParser, StreamingPageParser, extract_page_data
+
+# Ожидаемый разбор каждой страницы - чтобы совпадение движков не было пустым
+EXPECTED = {
+    "power_on.html": {
+        "has_power": True, "time_left": None,
+        "periods": ["02:30-06:30", "13:00-17:00", "20:30-23:00"],
+    },
+    "power_off.html": {
+        "has_power": False, "time_left": "2:15",
+        "periods": ["02:30-06:30", "13:00-17:00", "21:00-24:00"],
+    },
+    "no_outages.html": {
+        "has_power": True, "time_left": None, "periods": [],
+    },
+    "overnight_off.html": {
+        "has_power": False, "time_left": "0:45",
+        "periods": ["22:00-02:00", "09:00-11:30"],
+    },
+}
+
+def load_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'rb') as f:
+        return f.read()
+
+class FakeResponse:
+    """Ответ requests для потокового разбора: тело отдается кусками"""
+    encoding = 'utf-8'
+
+    def __init__(self, body, chunk_size):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        for i in range(0, len(self.body), self.chunk_size):
+            yield self.body[i:i + self.chunk_size]
+
+    def close(self):
+        self.closed = True
+
+def streaming_texts(body, chunk_size):
+    """Весь ответ через StreamingPageParser без ранней остановки"""
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    parser = StreamingPageParser()
+    for i in range(0, len(body), chunk_size):
+        parser.feed(decoder.decode(body[i:i + chunk_size]))
+    parser.feed(decoder.decode(b'', final=True))
+    parser.close()
+    return parser.texts
+
+def test_fixtures_are_covered():
+    assert sorted(EXPECTED) == sorted(name for name in os.listdir(FIXTURES_DIR) if name.endswith('.html'))
+
+@pytest.mark.parametrize("fixture", sorted(EXPECTED))
+@pytest.mark.parametrize("backend", sorted(PARSER_BACKENDS))
+def test_backend_output(fixture, backend):
+    page_html = load_fixture(fixture).decode('utf-8')
+    assert extract_page_data(PARSER_BACKENDS[backend](page_html)) == EXPECTED[fixture]
+
+@pytest.mark.parametrize("fixture", sorted(EXPECTED))
+@pytest.mark.parametrize("chunk_size", [1 << 20, 7])
+def test_streaming_parser_output(fixture, chunk_size):
+    # Кусками по 7 байт разрываются и теги, и многобайтные символы UTF-8
+    texts = streaming_texts(load_fixture(fixture), chunk_size)
+    assert extract_page_data(texts) == EXPECTED[fixture]
+
+@pytest.mark.parametrize("fixture", sorted(EXPECTED))
+@pytest.mark.parametrize("chunk_size", [1 << 20, 64, 7])
+def test_streaming_early_stop_output(fixture, chunk_size):
+    # Как в рабочем режиме STREAM_PARSE: загрузка прекращается, как только данные найдены
+    parser = KyivEnergyParser("http://127.0.0.1/", streaming=True)
+    try:
+        response = FakeResponse(load_fixture(fixture), chunk_size)
+        assert parser._parse_streaming(response) == EXPECTED[fixture]
+        assert response.closed
+    finally:
+        parser.close()
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Общий парсер power_parser.py: условные запросы, кэш разбора и Netlify webhook
+"""
+
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import webhook
+from conftest import FIXTURES_DIR
+import power_parser
+from power_parser import KyivEnergyParser, OutageSchedule
+
+class FixtureSite:
+    """Локальная замена energy-ua.info: отдает страницу из fixtures"""
+    def __init__(self):
+        self.page = "power_on.html"
+        self.etag = True
+        self.requests = 0
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                site.requests += 1
+                with open(os.path.join(FIXTURES_DIR, site.page), 'rb') as f:
+                    body = f.read()
+                tag = f'"{site.page}"'
+                if site.etag and self.headers.get('If-None-Match') == tag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/html; charset=utf-8')
+                self.send_header('Content-Length', str(len(body)))
+                if site.etag:
+                    self.send_header('ETag', tag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+@pytest.fixture
+def site():
+    site = FixtureSite()
+    yield site
+    site.close()
+
+@pytest.fixture
+def parser(site):
+    parser = KyivEnergyParser(site.url, retries=0, timeout=(2, 2))
+    yield parser
+    parser.close()
+
+def test_not_modified_reuses_parsed_page(site, parser):
+    first = parser.parse_power_status()
+    second = parser.parse_power_status()
+
+    assert first["today_periods"] == second["today_periods"] == ["02:30-06:30", "13:00-17:00", "20:30-23:00"]
+    assert parser.parse_stats["parsed"] == 1
+    assert parser.parse_stats["not_modified"] == 1
+
+def test_unchanged_body_without_validators_is_not_reparsed(site, parser):
+    site.etag = False
+    parser.parse_power_status()
+    parser.parse_power_status()
+
+    assert parser.parse_stats["parsed"] == 1
+    assert parser.parse_stats["unchanged_body"] == 1
+
+def test_failed_parse_does_not_keep_validators(site, parser, monkeypatch):
+    parser.parse_power_status()
+
+    # Страница изменилась, но ее разбор упал - следующий запрос не должен получить 304
+    site.page = "power_off.html"
+    monkeypatch.setattr(parser, '_parse_page', lambda page_html: 1 / 0)
+    assert parser.parse_power_status().get("is_fallback")
+
+    monkeypatch.undo()
+    status = parser.parse_power_status()
+    assert status["has_power"] is False
+    assert status["today_periods"] == ["02:30-06:30", "13:00-17:00", "21:00-24:00"]
+
+def test_webhook_reports_parsed_status(site, monkeypatch):
+    monkeypatch.setattr(webhook, 'energy_parser', None)
+    site.page = "power_off.html"
+
+    status = webhook.check_power_status(site.url)
+    json.dumps(status)  # Уходит в JSON ответа функции
+    assert status["has_power"] is False
+    assert status["time_left"] == "2:15"
+    assert "⏳ До включения: 2:15" in webhook.format_power_message(status)
+
+    # Теплый запуск функции: страница не менялась - без повторного разбора
+    webhook.check_power_status(site.url)
+    assert webhook.energy_parser.parse_stats["not_modified"] == 1
+    webhook.energy_parser.close()
+
+def minute(time_str):
+    hours, minutes = time_str.split(':')
+    return int(hours) * 60 + int(minutes)
+
+def test_overnight_schedule_shows_page_periods():
+    schedule = OutageSchedule(["02:30-06:30", "13:00-17:00", "22:00-02:00"])
+
+    # Для показа - периоды как на странице, без разреза в полночь
+    assert schedule.periods()[:3] == ["02:30-06:30", "13:00-17:00", "22:00-02:00"]
+    assert schedule.next_outage(minute("18:00")) == ("22:00-02:00", False)
+    assert schedule.next_outage(minute("07:00")) == ("13:00-17:00", False)
+
+def test_overnight_schedule_lookups():
+    schedule = OutageSchedule(["22:00-02:00", "09:00-11:30"])
+
+    assert schedule.is_outage(minute("23:30"))
+    assert schedule.is_outage(minute("01:00"))
+    assert not schedule.is_outage(minute("02:00"))
+    assert schedule.next_change(minute("23:00")) == 180
+    # Утренний хвост ночного периода - не следующее отключение
+    assert schedule.next_outage(minute("12:00")) == ("22:00-02:00", False)
+    assert schedule.next_outage(minute("03:00")) == ("09:00-11:30", False)
+
+def test_overnight_status_keeps_page_periods(site, parser, monkeypatch):
+    site.page = "overnight_off.html"
+    monkeypatch.setattr(power_parser, 'current_minute', lambda: minute("23:15"))
+
+    status = parser.parse_power_status()
+    assert status["has_power"] is False
+    assert status["time_left"] == "0:45"
+    assert status["today_periods"] == ["22:00-02:00", "09:00-11:30"]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+"""
+Ограничитель исходящих запросов: из очереди правок одного сообщения
+уходит только последняя
+"""
+
+import asyncio
+
+from rate_limiter import OutboundRateLimiter
+
+def test_superseded_edit_waiting_for_token_is_dropped():
+    # Один токен в ведре чата и 20 в секунду: вторая правка ждет токен
+    limiter = OutboundRateLimiter(chat_rate=20, chat_burst=1)
+    sent = []
+
+    async def edit(text):
+        async def callback():
+            sent.append(text)
+            return text
+        data = {"chat_id": 5, "message_id": 1, "text": text}
+        return await limiter.process_request(callback, (), {}, "editMessageText", data, None)
+
+    async def scenario():
+        tasks = []
+        for i in range(4):
+            tasks.append(asyncio.ensure_future(edit(f"e{i}")))
+            await asyncio.sleep(0.005)
+        return await asyncio.gather(*tasks)
+
+    results = asyncio.run(scenario())
+    assert results == ["e0", True, True, "e3"]
+    assert sent == ["e0", "e3"]
+    assert limiter.stats()["dropped"] == 2
+    assert limiter.stats()["sent"] == 2
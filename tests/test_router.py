@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""
+Маршрутизация текстовых сообщений route_text: те же маршруты, что у прежних
+проверок подстрок, но только по целым словам
+"""
+
+import random
+
+import pytest
+
+import svetbot
+from svetbot import route_text
+
+# Прежние ключевые слова handle_text (проверки any(word in text ...))
+OLD_KEYWORDS = [
+    ("light", ['свет', 'электричество', 'ток', 'света']),
+    ("status", ['статус', 'состояние', 'як справи']),
+    ("smoke", ['курить', 'покурить', 'дымить', 'косяк', 'травку', 'smoke']),
+    ("rating", ['рейтинг', 'топ', 'rating', 'курильщики']),
+    ("help", ['помощь', 'help']),
+]
+
+def route_substrings(text):
+    """Прежняя маршрутизация: первая группа, чье слово входит в текст подстрокой"""
+    text = text.lower()
+    for route, words in OLD_KEYWORDS:
+        if any(word in text for word in words):
+            return route
+    return None
+
+def route_words(text):
+    """Эталон по целым словам: весь текст режется регуляркой \\w+"""
+    text = text.lower()
+    found = [
+        svetbot.TEXT_ROUTE_WORDS[word] for word in svetbot.TEXT_WORD_RE.findall(text)
+        if word in svetbot.TEXT_ROUTE_WORDS
+        and svetbot.TEXT_ROUTE_PHRASES.get(word, word) in text
+    ]
+    return min(found, key=svetbot.TEXT_ROUTE_PRIORITY.get, default=None)
+
+@pytest.mark.parametrize("route,word", [(route, word) for route, words in OLD_KEYWORDS for word in words])
+def test_old_keywords_keep_their_routes(route, word):
+    for text in (word, f"Ну что, {word}?", f"{word.capitalize()}!!! когда", f"а {word}, ок"):
+        assert route_text(text) == route_substrings(text) == route
+
+@pytest.mark.parametrize("text,route", [
+    ("ветер с востока", None),             # 'ток' внутри слова
+    ("красивый рассвет", None),            # 'свет' внутри слова
+    ("топливо кончилось", None),           # 'топ' внутри слова
+    ("справи", None),                      # фраза 'як справи' целиком
+    ("як справи?", "status"),
+    ("є світло?", "light"),                # украинские формы
+    ("свет,ток", "light"),                 # слова склеены знаком
+    ("«топ» чата", "rating"),
+    ("_свет", None),                       # '_' - часть слова
+    ("покажи рейтинг и свет", "light"),    # приоритет маршрутов
+])
+def test_whole_word_routing(text, route):
+    assert route_text(text) == route
+
+def test_differences_from_substring_routing_are_the_intended_ones():
+    assert route_substrings("ветер с востока") == "light"
+    assert route_substrings("красивый рассвет") == "light"
+    assert route_substrings("є світло?") is None
+
+def test_fast_split_matches_regex_tokenizer():
+    rng = random.Random(3)
+    vocabulary = [form for form in svetbot.TEXT_ROUTE_WORDS] + "привет как дела востока рассвет 42 foo_bar".split()
+    for _ in range(5000):
+        words = rng.choices(vocabulary, k=rng.randint(1, 8))
+        text = "".join(word + rng.choice([" ", " ", " ", ", ", "!", "?", ",", "«", "» ", "_", "-"]) for word in words)
+        assert route_text(text) == route_words(text), text
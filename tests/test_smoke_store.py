@@ -0,0 +1,208 @@
+# -*- coding: utf-8 -*-
+"""
+Хранилища статистики /smoke из smoke_store.py
+"""
+
+import json
+import os
+import sqlite3
+
+from smoke_store import ChatSmokeStore, JournalSmokeStore, Leaderboard, SQLiteSmokeStore
+
+OLD_STATS = {
+    "1": {"name": "Тарас", "count": 12, "last_smoke": "2026-10-01 10:00"},
+    "2": {"name": "Оксана", "count": 3, "last_smoke": "2026-10-02 11:00"},
+}
+
+def write_json(path, data):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, ensure_ascii=False)
+
+def test_sqlite_migrates_old_json_once(tmp_path):
+    json_path = str(tmp_path / "smoke_stats.json")
+    db_path = str(tmp_path / "smoke_stats.db")
+    write_json(json_path, OLD_STATS)
+
+    store = SQLiteSmokeStore(db_path, json_path=json_path)
+    assert store.export() == OLD_STATS
+    assert store.top(2) == [("1", {"name": "Тарас", "count": 12}), ("2", {"name": "Оксана", "count": 3})]
+    assert store.increment("2", "Оксана", "2026-10-18 12:00") == 4
+    store.close()
+
+    # Старый файл остался, но повторно не переносится и не затирает счетчики
+    store = SQLiteSmokeStore(db_path, json_path=json_path)
+    assert store.get("2")["count"] == 4
+    store.close()
+
+def test_sqlite_uses_wal_and_counts_atomically(tmp_path):
+    db_path = str(tmp_path / "smoke_stats.db")
+    store = SQLiteSmokeStore(db_path, json_path=None)
+    for _ in range(3):
+        store.increment("1", "Тарас", "2026-10-18 12:00")
+
+    # Второе соединение, как у другого процесса, видит закоммиченный счетчик
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("SELECT count FROM smoke_stats WHERE user_id = '1'").fetchone()[0] == 3
+    conn.close()
+    store.close()
+
+def test_sqlite_skips_unreadable_json(tmp_path):
+    json_path = tmp_path / "smoke_stats.json"
+    json_path.write_text("{не json", encoding='utf-8')
+
+    store = SQLiteSmokeStore(str(tmp_path / "smoke_stats.db"), json_path=str(json_path))
+    assert store.export() == {}
+    assert store.increment("1", "Тарас", "2026-10-18 12:00") == 1
+    store.close()
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+def test_journal_replays_after_restart(tmp_path):
+    snapshot_path = str(tmp_path / "smoke_stats.json")
+    write_json(snapshot_path, OLD_STATS)
+
+    store = JournalSmokeStore(snapshot_path, flush_every=2)
+    store.increment("1", "Тарас", "2026-10-18 12:00")
+    assert not store.should_flush()
+    store.increment("3", "Богдан", "2026-10-18 12:05")
+    assert store.should_flush()
+    store.flush()
+
+    # Снимок не менялся - изменения только в журнале
+    assert len(read_lines(store.journal_path)) == 2
+    with open(snapshot_path, encoding='utf-8') as f:
+        assert json.load(f) == OLD_STATS
+
+    # Падение без close(): при старте журнал повторяется поверх снимка
+    restarted = JournalSmokeStore(snapshot_path)
+    assert restarted.get("1")["count"] == 13
+    assert restarted.get("3") == {"name": "Богдан", "count": 1, "last_smoke": "2026-10-18 12:05"}
+    assert restarted.top(1) == [("1", {"name": "Тарас", "count": 13})]
+
+def test_journal_recovers_from_torn_last_line(tmp_path):
+    snapshot_path = str(tmp_path / "smoke_stats.json")
+    store = JournalSmokeStore(snapshot_path)
+    store.increment("1", "Тарас", "2026-10-18 12:00")
+    store.increment("1", "Тарас", "2026-10-18 12:01")
+    store.flush()
+
+    # Процесс упал посреди записи строки
+    with open(store.journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"user_id": "1", "name": "Тар')
+
+    recovered = JournalSmokeStore(snapshot_path)
+    assert recovered.get("1")["count"] == 2
+    # Журнал свернут в снимок, иначе следующая запись склеилась бы с обрывком
+    assert read_lines(recovered.journal_path) == []
+
+    recovered.increment("1", "Тарас", "2026-10-18 12:02")
+    recovered.flush()
+    assert JournalSmokeStore(snapshot_path).get("1")["count"] == 3
+
+def test_journal_compacts_into_snapshot(tmp_path):
+    snapshot_path = str(tmp_path / "smoke_stats.json")
+    store = JournalSmokeStore(snapshot_path, flush_every=1, compact_every=3)
+    for minute in range(3):
+        store.increment("1", "Тарас", f"2026-10-18 12:0{minute}")
+        store.flush()
+
+    assert read_lines(store.journal_path) == []
+    with open(snapshot_path, encoding='utf-8') as f:
+        assert json.load(f)["1"]["count"] == 3
+
+    store.increment("2", "Оксана", "2026-10-18 12:10")
+    store.close()
+    assert JournalSmokeStore(snapshot_path).export() == {
+        "1": {"name": "Тарас", "count": 3, "last_smoke": "2026-10-18 12:02"},
+        "2": {"name": "Оксана", "count": 1, "last_smoke": "2026-10-18 12:10"},
+    }
+
+def test_leaderboard_rank_after_updates():
+    board = Leaderboard({user_id: {"name": data["name"], "count": data["count"]} for user_id, data in OLD_STATS.items()})
+    board.update("3", 5, "Богдан")
+    assert [user_id for user_id, data in board.top(10)] == ["1", "3", "2"]
+    assert board.position("3") == 2
+
+    # Обгон: счетчик вырос - место пересчитано, старый ключ убран
+    board.update("2", 13, "Оксана")
+    assert board.top(10) == [
+        ("2", {"name": "Оксана", "count": 13}),
+        ("1", {"name": "Тарас", "count": 12}),
+        ("3", {"name": "Богдан", "count": 5}),
+    ]
+    assert [board.position(user_id) for user_id in ("1", "2", "3")] == [2, 1, 3]
+    assert board.position("9") is None
+    assert board.count("9") == 0
+    assert len(board) == 3
+
+def test_leaderboard_ties_are_ordered_by_user_id():
+    board = Leaderboard()
+    for user_id in ("b", "a", "c"):
+        board.update(user_id, 1, user_id.upper())
+    assert [user_id for user_id, data in board.top(3)] == ["a", "b", "c"]
+    assert board.position("c") == 3
+
+def test_leaderboard_rerenders_only_changed_top():
+    board = Leaderboard()
+    for i in range(6):
+        board.update(str(i), 10 - i, f"user{i}")
+
+    renders = []
+    def render(top):
+        renders.append(top)
+        return " ".join(f"{user_id}:{data['count']}" for user_id, data in top)
+
+    assert board.render(3, render) == "0:10 1:9 2:8"
+    assert board.render(3, render) == "0:10 1:9 2:8"
+    # Изменение ниже топа не сбрасывает его текст
+    board.update("5", 6, "user5")
+    assert board.render(3, render) == "0:10 1:9 2:8"
+    assert len(renders) == 1
+
+    # Пользователь вошел в топ - текст отрисовывается заново
+    board.update("4", 9, "user4")
+    assert board.render(3, render) == "0:10 1:9 4:9"
+    # Изменился счетчик внутри топа
+    board.update("0", 11, "user0")
+    assert board.render(3, render) == "0:11 1:9 4:9"
+    assert len(renders) == 3
+
+def make_chat_store(tmp_path, seed_chat_id=-100, **kwargs):
+    global_path = str(tmp_path / "smoke_stats.json")
+    write_json(global_path, OLD_STATS)
+    chats_dir = tmp_path / "smoke_chats"
+    chats_dir.mkdir(exist_ok=True)
+
+    def open_partition(chat_id):
+        return JournalSmokeStore(os.path.join(str(chats_dir), f"{chat_id}.json"))
+
+    return ChatSmokeStore(open_partition, JournalSmokeStore(global_path), seed_chat_id=seed_chat_id, **kwargs)
+
+def test_seed_chat_gets_old_global_stats(tmp_path):
+    store = make_chat_store(tmp_path)
+
+    # Первый /smoke в основном чате: общий счетчик переносится до +1
+    assert store.increment(-100, "1", "Тарас", "2026-10-18 12:00") == 13
+    assert store.leaderboard(None).count("1") == 13
+    assert store.leaderboard(-100).count("2") == 3
+
+    # Другие чаты начинают с нуля
+    assert store.increment(-200, "1", "Тарас", "2026-10-18 12:01") == 1
+    assert store.leaderboard(None).count("1") == 14
+    assert len(store.leaderboard(-200)) == 1
+
+def test_seed_is_not_repeated_after_reopen(tmp_path):
+    store = make_chat_store(tmp_path, idle_timeout=0)
+    store.increment(-100, "1", "Тарас", "2026-10-18 12:00")
+    store.increment(-200, "2", "Оксана", "2026-10-18 12:01")
+
+    # Разделы закрываются как неактивные и открываются снова
+    store.flush()
+    assert store.cached_partition(-100) is None
+    assert store.increment(-100, "2", "Оксана", "2026-10-18 12:02") == 4
+    assert store.leaderboard(-100).count("1") == 13
+    assert store.leaderboard(None).count("2") == 5
+    store.close()
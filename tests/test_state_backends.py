@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+"""
+Хранилища статистики /smoke Netlify бота (STATE_BACKEND): память, SQLite,
+Redis через REST API и кэш чтений поверх них
+"""
+
+import pytest
+
+import bot
+from conftest import FakeKVSession
+
+@pytest.fixture
+def kv_session(monkeypatch):
+    session = FakeKVSession()
+    monkeypatch.setattr(bot, "http_session", session)
+    return session
+
+@pytest.fixture(params=["memory", "sqlite", "kv", "cached"])
+def backend(request, kv_session):
+    if request.param == "memory":
+        return bot.MemoryStateBackend()
+    if request.param == "sqlite":
+        return bot.SQLiteStateBackend(":memory:")
+    if request.param == "kv":
+        return bot.KVStateBackend("https://kv.test/", "token")
+    return bot.CachedStateBackend(bot.SQLiteStateBackend(":memory:"), ttl=60)
+
+def smoke(backend, chat_id, user_id, name, times=1):
+    count = None
+    for _ in range(times):
+        count = backend.increment(chat_id, user_id, name, "2026-10-18 12:00")
+    return count
+
+def test_increment_counts_per_chat_and_globally(backend):
+    assert smoke(backend, -100, "1", "Тарас", times=3) == 3
+    assert smoke(backend, -200, "1", "Тарас") == 1
+    assert smoke(backend, -200, "2", "Оксана", times=2) == 2
+
+    chat = backend.leaderboard(-200)
+    assert chat["top"] == [("2", {"name": "Оксана", "count": 2}), ("1", {"name": "Тарас", "count": 1})]
+    assert chat["total"] == 2
+
+    overall = backend.leaderboard(None)
+    assert overall["top"] == [("1", {"name": "Тарас", "count": 4}), ("2", {"name": "Оксана", "count": 2})]
+    assert backend.user_count() == 2
+
+def test_leaderboard_position_and_limit(backend):
+    for user_id, times in [("1", 1), ("2", 5), ("3", 3), ("4", 4)]:
+        smoke(backend, -100, user_id, f"user{user_id}", times=times)
+
+    board = backend.leaderboard(-100, "3", limit=2)
+    assert [user_id for user_id, data in board["top"]] == ["2", "4"]
+    assert board["position"] == 3
+    assert board["total"] == 4
+
+    assert backend.leaderboard(-100, "9")["position"] is None
+    assert backend.leaderboard(-300) == {"top": [], "position": None, "total": 0}
+
+def test_sqlite_state_survives_reopen(tmp_path):
+    path = str(tmp_path / "state.db")
+    smoke(bot.SQLiteStateBackend(path), -100, "1", "Тарас", times=2)
+
+    # Новый экземпляр функции видит те же счетчики
+    reopened = bot.SQLiteStateBackend(path)
+    assert reopened.leaderboard(-100)["top"] == [("1", {"name": "Тарас", "count": 2})]
+    assert reopened.leaderboard(None)["total"] == 1
+
+def test_kv_increment_is_one_multi_exec(kv_session):
+    backend = bot.KVStateBackend("https://kv.test/", "token")
+    smoke(backend, -100, "1", "Тарас")
+
+    endpoint, commands = kv_session.calls[0]
+    assert endpoint == "multi-exec"
+    assert [command[0] for command in commands] == ["ZINCRBY", "ZINCRBY", "HSET", "HSET"]
+
+def test_cached_reads_until_own_write():
+    inner = bot.SQLiteStateBackend(":memory:")
+    cached = bot.CachedStateBackend(inner, ttl=60)
+    smoke(cached, -100, "1", "Тарас")
+    assert cached.leaderboard(-100)["top"][0][1]["count"] == 1
+
+    # Запись другого экземпляра видна только после ttl
+    smoke(inner, -100, "1", "Тарас")
+    assert cached.leaderboard(-100)["top"][0][1]["count"] == 1
+
+    # Своя запись сбрасывает кэш сразу
+    smoke(cached, -100, "1", "Тарас")
+    assert cached.leaderboard(-100)["top"][0][1]["count"] == 3
+
+def test_cached_entry_expires_after_ttl(monkeypatch):
+    inner = bot.SQLiteStateBackend(":memory:")
+    cached = bot.CachedStateBackend(inner, ttl=5)
+    now = [1000.0]
+    monkeypatch.setattr(bot.time, "monotonic", lambda: now[0])
+
+    smoke(inner, -100, "1", "Тарас")
+    assert cached.leaderboard(-100)["total"] == 1
+    smoke(inner, -100, "2", "Оксана")
+    assert cached.leaderboard(-100)["total"] == 1
+
+    now[0] += 6
+    assert cached.leaderboard(-100)["total"] == 2
+
+def test_cache_is_bounded_lru():
+    cached = bot.CachedStateBackend(bot.MemoryStateBackend(), ttl=60, size=3)
+    for chat_id in (1, 2, 3):
+        cached.leaderboard(chat_id)
+    cached.leaderboard(1)
+    cached.leaderboard(4)
+
+    # Вытеснен самый давно прочитанный рейтинг, а не первый добавленный
+    assert len(cached._cache) == 3
+    assert [key[0] for key in cached._cache] == [3, 1, 4]
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Повторные доставки webhook Netlify бота отбрасываются по update_id,
+а обновление, которое не удалось принять, можно доставить снова
+"""
+
+import json
+from collections import OrderedDict
+
+import pytest
+
+import bot
+from conftest import FakeKVSession
+
+@pytest.fixture(params=["sqlite", "kv"])
+def shared_state(request, monkeypatch):
+    monkeypatch.setattr(bot, "recent_updates", OrderedDict())
+    monkeypatch.setattr(bot, "duplicate_updates", 0)
+    monkeypatch.setattr(bot, "http_session", FakeKVSession())
+    if request.param == "sqlite":
+        backend = bot.SQLiteStateBackend(":memory:")
+    else:
+        backend = bot.KVStateBackend("https://kv.test/", "token")
+    monkeypatch.setattr(bot, "state", bot.CachedStateBackend(backend))
+    return backend
+
+def post(update):
+    return bot.lambda_handler({"httpMethod": "POST", "body": json.dumps(update)}, {})
+
+def info_update(update_id):
+    return {"update_id": update_id, "message": {"chat": {"id": 5}, "from": {"id": 7, "first_name": "A"}, "text": "/info"}}
+
+def test_redelivery_is_skipped(shared_state):
+    assert bot.claim_update(1)
+    assert not bot.claim_update(1)
+
+    # Другой экземпляр функции: своей памяти нет, отказывает общее хранилище
+    bot.recent_updates.clear()
+    assert not bot.claim_update(1)
+    assert bot.duplicate_updates == 2
+    assert bot.claim_update(2)
+
+def test_release_allows_redelivery(shared_state):
+    assert bot.claim_update(1)
+    bot.release_update(1)
+    assert 1 not in bot.recent_updates
+    assert bot.claim_update(1)
+
+def test_failed_backend_claim_is_not_remembered(shared_state, monkeypatch):
+    def unavailable(update_id, window):
+        raise ConnectionError("хранилище недоступно")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(shared_state, "claim_update", unavailable)
+        with pytest.raises(ConnectionError):
+            bot.claim_update(1)
+    assert 1 not in bot.recent_updates
+
+    assert bot.claim_update(1)
+
+def test_webhook_answers_duplicate_without_processing(shared_state):
+    first = post(info_update(10))
+    assert json.loads(first["body"])["method"] == "sendMessage"
+
+    second = json.loads(post(info_update(10))["body"])
+    assert second == {"message": "Duplicate update skipped", "update_id": 10}
+
+def test_enqueue_error_releases_claim(shared_state, monkeypatch):
+    class BrokenQueue:
+        def push(self, update):
+            raise ConnectionError("очередь недоступна")
+
+    monkeypatch.setattr(bot, "update_queue", BrokenQueue())
+    assert post(info_update(11))["statusCode"] == 500
+
+    # Telegram доставит обновление еще раз - его нужно принять, а не отбросить
+    monkeypatch.setattr(bot, "update_queue", None)
+    assert json.loads(post(info_update(11))["body"])["method"] == "sendMessage"
+
+def test_whitespace_message_gets_a_reply(shared_state):
+    update = info_update(12)
+    update["message"]["text"] = "   "
+    reply = json.loads(post(update)["body"])
+    assert reply["method"] == "sendMessage"
+    assert 12 in bot.recent_updates
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Очередь обновлений Netlify бота (UPDATE_QUEUE): повтор после ошибки отправки
+не выполняет обновление второй раз, а безнадежное обновление откладывается
+"""
+
+import pytest
+
+import bot
+from conftest import FakeKVSession
+
+def smoke_update(update_id, chat_id=-100, user_id=7):
+    return {
+        "update_id": update_id,
+        "message": {"chat": {"id": chat_id}, "from": {"id": user_id, "first_name": "Тарас"}, "text": "/smoke"}
+    }
+
+class FakeTelegram:
+    """call_telegram_api без сети: первые fail_times ответов с рангом падают"""
+    def __init__(self, fail_times=0):
+        self.fail_times = fail_times
+        self.sent = []
+
+    def __call__(self, method, payload, bot_token, retries=2):
+        if "Ваш ранг" in payload.get("text", "") and self.fail_times:
+            self.fail_times -= 1
+            raise ConnectionError("api.telegram.org недоступен")
+        self.sent.append((method, payload.get("chat_id"), payload.get("text") or payload.get("animation")))
+        return {"ok": True, "result": {}}
+
+@pytest.fixture
+def queue(monkeypatch):
+    queue = bot.SQLiteUpdateQueue(":memory:")
+    monkeypatch.setattr(bot, "update_queue", queue)
+    monkeypatch.setattr(bot, "state", bot.SQLiteStateBackend(":memory:"))
+    return queue
+
+@pytest.fixture(params=["sqlite", "kv"])
+def any_queue(request, monkeypatch):
+    if request.param == "sqlite":
+        return bot.SQLiteUpdateQueue(":memory:")
+    monkeypatch.setattr(bot, "http_session", FakeKVSession())
+    return bot.KVUpdateQueue(bot.KVStateBackend("https://kv.test/", "token"))
+
+def test_peek_does_not_remove(any_queue):
+    for update_id in (1, 2, 3):
+        any_queue.push({"update_id": update_id})
+
+    batch = any_queue.peek_batch(2)
+    assert [update for key, update in batch] == [{"update_id": 1}, {"update_id": 2}]
+    # Без ack обновления остаются в очереди и читаются снова
+    assert any_queue.peek_batch(2) == batch
+
+def test_ack_removes_only_its_update(any_queue):
+    for update_id in (1, 2, 3):
+        any_queue.push({"update_id": update_id})
+
+    batch = any_queue.peek_batch(10)
+    any_queue.ack(batch[1][0])
+    assert [update["update_id"] for key, update in any_queue.peek_batch(10)] == [1, 3]
+
+def test_fail_counts_attempts_and_park_removes(any_queue):
+    any_queue.push({"update_id": 1})
+    any_queue.push({"update_id": 2})
+    key = any_queue.peek_batch(1)[0][0]
+
+    assert any_queue.fail(key) == 1
+    assert any_queue.fail(key) == 2
+    any_queue.park(key)
+    assert [update["update_id"] for key, update in any_queue.peek_batch(10)] == [2]
+
+def test_drain_acks_processed_updates(any_queue, monkeypatch):
+    monkeypatch.setattr(bot, "update_queue", any_queue)
+    monkeypatch.setattr(bot, "state", bot.MemoryStateBackend())
+    telegram = FakeTelegram()
+    monkeypatch.setattr(bot, "call_telegram_api", telegram)
+    for update_id in range(1, 6):
+        any_queue.push(smoke_update(update_id, user_id=update_id))
+
+    assert bot.drain_update_queue("token", batch_size=2) == 5
+    assert any_queue.peek_batch(10) == []
+    assert bot.state.leaderboard(-100)["total"] == 5
+
+def test_drain_stops_at_time_budget(queue, monkeypatch):
+    monkeypatch.setattr(bot, "call_telegram_api", FakeTelegram())
+    queue.push(smoke_update(1))
+
+    assert bot.drain_update_queue("token", time_budget=0) == 0
+    assert len(queue.peek_batch(10)) == 1
+
+def test_failed_send_is_retried_without_recording_twice(queue, monkeypatch):
+    telegram = FakeTelegram(fail_times=1)
+    monkeypatch.setattr(bot, "call_telegram_api", telegram)
+    queue.push(smoke_update(1))
+
+    assert bot.drain_update_queue("token") == 0
+    assert len(queue.peek_batch(10)) == 1
+
+    assert bot.drain_update_queue("token") == 1
+    assert queue.peek_batch(10) == []
+
+    board = bot.state.leaderboard(-100, "7")
+    assert board["top"] == [("7", {"name": "Тарас", "count": 1})]
+    # Фраза ушла один раз при первой попытке, повтор отправил только ранг
+    texts = [text for method, chat_id, text in telegram.sent]
+    assert len(texts) == 2
+    assert texts[0].endswith("(#1)")
+    assert "Покуров: 1" in texts[1]
+
+def test_update_is_parked_after_max_attempts(queue, monkeypatch):
+    telegram = FakeTelegram(fail_times=bot.MAX_UPDATE_ATTEMPTS)
+    monkeypatch.setattr(bot, "call_telegram_api", telegram)
+    queue.push(smoke_update(1))
+    queue.push(smoke_update(2, user_id=8))
+
+    for _ in range(bot.MAX_UPDATE_ATTEMPTS - 1):
+        assert bot.drain_update_queue("token") == 0
+
+    # Последняя попытка откладывает первое обновление, второе проходит следом
+    assert bot.drain_update_queue("token") == 1
+    assert queue.peek_batch(10) == []
+    assert queue._conn.execute("SELECT COUNT(*) FROM update_queue_dead").fetchone()[0] == 1
+    assert bot.state.leaderboard(-100)["total"] == 2
+    assert dict(bot.state.leaderboard(-100)["top"])["7"]["count"] == 1
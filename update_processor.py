@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Параллельная обработка обновлений с сохранением порядка внутри чата для SVETOBOT
+"""
+
+import asyncio
+
+from telegram.ext import BaseUpdateProcessor
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Обработчик обновлений для Application.builder().concurrent_updates().
+    Разные чаты обрабатываются параллельно не более чем в workers потоков,
+    а обновления одного чата - строго по очереди. Сначала берется замок
+    чата и только потом место в пуле, поэтому очередь одного чата
+    не занимает места других чатов.
+    max_pending ограничивает число обновлений в работе вместе с ожидающими.
+    """
+    __slots__ = ("workers", "_workers", "_chat_locks", "_waiting")
+
+    def __init__(self, workers=8, max_pending=256):
+        super().__init__(max(workers, max_pending))
+        self.workers = workers
+        self._workers = asyncio.BoundedSemaphore(workers)
+        self._chat_locks = {}
+        self._waiting = {}
+
+    async def do_process_update(self, update, coroutine):
+        chat = getattr(update, "effective_chat", None)
+        if chat is None:
+            async with self._workers:
+                await coroutine
+            return
+
+        chat_id = chat.id
+        lock = self._chat_locks.get(chat_id)
+        if lock is None:
+            lock = self._chat_locks[chat_id] = asyncio.Lock()
+        self._waiting[chat_id] = self._waiting.get(chat_id, 0) + 1
+        try:
+            async with lock:
+                async with self._workers:
+                    await coroutine
+        finally:
+            self._waiting[chat_id] -= 1
+            if not self._waiting[chat_id]:
+                del self._waiting[chat_id]
+                del self._chat_locks[chat_id]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass